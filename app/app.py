@@ -1,13 +1,87 @@
+import functools
+import hashlib
+import mimetypes
 import os
+from datetime import date, datetime, timezone
+from urllib.parse import quote
 
-from flask import Flask, render_template, send_from_directory
+import numpy as np
+import pandas as pd
+from flask import (
+    Flask,
+    Response,
+    abort,
+    jsonify,
+    render_template,
+    request,
+    send_from_directory,
+)
+from markupsafe import Markup
+from werkzeug.http import is_resource_modified
 
+import metrics
+import page_cache
 from data_reader import KnaDB
-from logging_kna import logger
+import logging_kna
 
-db_reader = KnaDB(dir_resources="/data/resources/")
+db_reader = KnaDB(
+    dir_resources="/data/resources/",
+    snapshot=os.environ.get("KNA_SNAPSHOT", "0") == "1",
+    snapshot_results_max=int(os.environ.get("KNA_SNAPSHOT_RESULTS", "512")),
+    backend=os.environ.get("KNA_BACKEND", "mariadb"),
+    file_sqlite=os.environ.get("KNA_SQLITE"),
+    concurrent=os.environ.get("KNA_CONCURRENT", "0") == "1",
+    max_workers=int(os.environ.get("KNA_DB_WORKERS", "4")),
+    query_timeout=float(os.environ.get("KNA_QUERY_TIMEOUT", "10")),
+    dir_shared=os.environ.get("KNA_SHARED_DIR"),
+)
+
+logger = logging_kna.get_logger("app")
+logger_cdn = logging_kna.get_logger("cdn")
 
 app = Flask(__name__)
+logging_kna.init_app(app)
+metrics.init_app(app)
+page_cache.set_reader(db_reader)
+
+# Leesmethoden van KnaDB waarvan de pagina's de resultaten tonen
+READERS = [
+    "lid_info",
+    "lid_rollen",
+    "lid_media",
+    "leden",
+    "voorstelling_info",
+    "voorstelling_rollen",
+    "voorstelling_media",
+    "voorstelling_thumbnail",
+    "voorstellingen",
+    "voorstelling_lid_media",
+    "medium",
+    "timeline",
+    "leden_page",
+    "voorstellingen_page",
+    "timeline_page",
+    "zoek",
+]
+metrics.instrument_reader(db_reader, READERS)
+
+# Media via nginx laten versturen (X-Accel-Redirect), zie nginx-https.conf.template
+CDN_X_ACCEL = os.environ.get("KNA_X_ACCEL", "0") == "1"
+CDN_X_ACCEL_LOCATION = "/protected_resources/"
+CDN_MAX_AGE = 3600
+CDN_MAX_AGE_IMMUTABLE = 31536000
+CDN_VERSION_LENGTH = 12
+DIR_STATIC = os.path.normpath("static")
+
+# Paginagrootte van de overzichten; de rest wordt geladen tijdens het scrollen
+PAGE_SIZE_LEDEN = 40
+PAGE_SIZE_VOORSTELLINGEN = 10
+PAGE_SIZE_JAREN = 10
+PAGE_SIZE_MAX = 100
+
+# Aantal zoekresultaten op /zoek en standaard bij autocomplete via /api/zoek
+ZOEK_RESULTATEN = 50
+ZOEK_AUTOCOMPLETE = 8
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -20,84 +94,370 @@ def home():
     return render_template("home.html")
 
 
-@app.route("/cdn/<path:filepath>")
-def cdn(filepath):
-    dir, filename = os.path.split(db_reader.decode(filepath))
-    logger.info(f"Serve media CDN - Directory: {dir} - File: {filename}")
-    return send_from_directory(dir, filename, as_attachment=False)
+@functools.lru_cache(maxsize=None)
+def static_version(path: str) -> str:
+    """Versie van een afbeelding uit de app, die wijzigt alleen met de app zelf"""
+    with open(path, "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()[:CDN_VERSION_LENGTH]
+
+
+def file_version(path: str) -> str:
+    """Versie van een bestand dat niet in het manifest staat, uit grootte en mtime;
+    None wanneer het bestand niet bestaat"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    text = f"{stat.st_size}-{stat.st_mtime_ns}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:CDN_VERSION_LENGTH]
+
+
+def media_version(id_media: str) -> str:
+    """Versie van een medium voor de /cdn URL: de sha1 van de inhoud volgens het
+    manifest, zodat de URL alleen wijzigt wanneer het bestand wijzigt
+
+    Zonder manifest (of regel in het manifest) volgt de versie uit grootte en mtime
+    van het bestand.
+    """
+    path = db_reader.media_path(id_media=id_media)
+    if path is None:
+        return None
+    info = db_reader.file_info(path)
+    if info is not None:
+        return info["sha1"][:CDN_VERSION_LENGTH]
+    if path_within(os.path.normpath(path), DIR_STATIC):
+        return static_version(os.path.normpath(path))
+    return file_version(path)
+
+
+@app.template_filter("cdn")
+def cdn_url(id_media: str) -> str:
+    """/cdn URL van een medium met de versie, zodat de browser het mag bewaren"""
+    version = media_version(id_media)
+    if version is None:
+        return f"/cdn/{id_media}"
+    return f"/cdn/{id_media}?v={version}"
+
+
+@app.template_filter("srcset")
+def srcset(variants: list) -> str:
+    """srcset attribuut voor de versies per breedte van een afbeelding"""
+    return ", ".join(
+        f"{cdn_url(variant['id_media'])} {variant['width']}w" for variant in variants
+    )
+
+
+@app.template_filter("afmetingen")
+def afmetingen(id_media: str, width: int = None, height: int = None) -> Markup:
+    """width en height attributen van een medium volgens het manifest
+
+    Geschaald naar de opgegeven breedte of hoogte, zodat de browser de ruimte van
+    de afbeelding al reserveert voordat die geladen is.
+    """
+    path = db_reader.media_path(id_media=id_media)
+    info = db_reader.file_info(path) if path is not None else None
+    if info is not None and info["width"] and info["height"]:
+        if height is not None:
+            width = round(info["width"] * height / info["height"])
+        elif width is not None:
+            height = round(info["height"] * width / info["width"])
+        else:
+            width, height = info["width"], info["height"]
+    attributes = []
+    if width is not None:
+        attributes.append(f'width="{width}"')
+    if height is not None:
+        attributes.append(f'height="{height}"')
+    return Markup(" ".join(attributes))
+
+
+def path_within(path: str, directory: str) -> bool:
+    try:
+        return os.path.commonpath([directory, path]) == directory
+    except ValueError:
+        return False
+
+
+def cdn_cache_control(response: Response, id_media: str) -> Response:
+    version = request.args.get("v")
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    if version is not None and version == media_version(id_media):
+        response.cache_control.max_age = CDN_MAX_AGE_IMMUTABLE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = CDN_MAX_AGE
+    return response
+
+
+@app.route("/cdn/<id_media>")
+def cdn(id_media):
+    path = db_reader.media_path(id_media=id_media)
+    if path is None:
+        abort(404)
+    # WebP versturen aan browsers die het accepteren
+    path_webp = db_reader.media_path(id_media=id_media, webp=True)
+    negotiated = path_webp != path
+    if negotiated and "image/webp" in request.headers.get("Accept", ""):
+        path = path_webp
+    path = os.path.normpath(path)
+    dir, filename = os.path.split(path)
+    logger_cdn.debug("Serve media CDN - Directory: %s - File: %s", dir, filename)
+    dir_resources = os.path.normpath(db_reader.dir_resources)
+    in_resources = path_within(path, dir_resources)
+    in_static = path_within(path, DIR_STATIC)
+    if not in_resources and not in_static:
+        abort(404)
+
+    # Grootte, mtime en sha1 uit het manifest, zodat HEAD en conditionele
+    # requests zonder schijftoegang worden beantwoord
+    info = db_reader.file_info(path) if in_resources else None
+    if info is None and (not CDN_X_ACCEL or not in_resources):
+        response = send_from_directory(dir, filename, as_attachment=False)
+        if response.status_code == 200:
+            metrics.add_cdn_bytes(response.content_length or 0)
+        if negotiated:
+            response.vary.add("Accept")
+        return cdn_cache_control(response, id_media)
+
+    if info is None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            abort(404)
+        info = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "sha1": None}
+    etag = info["sha1"] or f"{info['mtime']:x}-{info['size']:x}"
+    last_modified = datetime.fromtimestamp(info["mtime"] / 1e9, tz=timezone.utc)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    if not is_resource_modified(
+        request.environ, etag=etag, last_modified=last_modified
+    ):
+        response = Response(status=304)
+    elif request.method == "HEAD":
+        response = Response(mimetype=mimetype)
+        response.content_length = info["size"]
+    elif CDN_X_ACCEL:
+        # Bestand laten versturen door nginx, de app controleert alleen het pad
+        response = Response(mimetype=mimetype)
+        path_relative = os.path.relpath(path, dir_resources)
+        response.headers["X-Accel-Redirect"] = CDN_X_ACCEL_LOCATION + quote(
+            path_relative
+        )
+        metrics.add_cdn_bytes(info["size"])
+    else:
+        response = send_from_directory(dir, filename, as_attachment=False, etag=etag)
+        metrics.add_cdn_bytes(response.content_length or 0)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    if negotiated:
+        response.vary.add("Accept")
+    return cdn_cache_control(response, id_media)
 
 
 @app.route("/image/<path_image>")
+@page_cache.cached
 def show_image(path_image: str):
-    logger.info(f"Show image - filepath: {path_image}")
-    dict_image = db_reader.medium(path=path_image)
+    logger.info("Show image - filepath: %s", path_image)
+    dict_image = db_reader.medium(id_media=path_image)
+    if dict_image is None:
+        abort(404)
     return render_template("image.html", image=dict_image)
 
 @app.route("/pdf/<path_pdf>")
 def show_document(path_pdf: str):
-    logger.info(f"Show PDF - {path_pdf}")
+    logger.info("Show PDF - %s", path_pdf)
     return render_template("pdf.html", file_pdf=path_pdf)
 
 
 @app.route("/video/<path_video>")
+@page_cache.cached
 def show_movie(path_video: str):
-    logger.info(f"Show video - {path_video}")
-    dict_video = db_reader.medium(path=path_video)
+    logger.info("Show video - %s", path_video)
+    dict_video = db_reader.medium(id_media=path_video)
+    if dict_video is None:
+        abort(404)
     return render_template("video.html", video=dict_video)
 
 
+def read_page(reader, page_size: int) -> dict:
+    """Pagina volgens de cursor en limit van het request, 400 bij een foute cursor"""
+    limit = request.args.get("limit", default=page_size, type=int)
+    limit = max(1, min(limit, PAGE_SIZE_MAX))
+    try:
+        return reader(cursor=request.args.get("cursor"), limit=limit)
+    except ValueError:
+        abort(400)
+
+
+def json_value(value):
+    """Maakt datums, NaN en numpy getallen geschikt voor JSON"""
+    if isinstance(value, dict):
+        return {key: json_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [json_value(item) for item in value]
+    if value is None or isinstance(value, str):
+        return value
+    if pd.isna(value):
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def json_page(dict_page: dict, template: str, name: str) -> Response:
+    """JSON van een pagina; met ?html=1 ook de items als HTML voor de overzichten"""
+    result = {"items": json_value(dict_page["items"]), "next": dict_page["next"]}
+    if request.args.get("html") == "1":
+        result["html"] = render_template(template, **{name: dict_page["items"]})
+    return jsonify(result)
+
+
 @app.route("/leden")
+@page_cache.cached
 def view_leden():
     """Page for viewing members"""
-    lst_leden = db_reader.leden()
-    # reports = sorted(reports, key=lambda x: x['last_modified'], reverse=True)
-    return render_template("leden.html", leden=lst_leden)
+    dict_page = read_page(db_reader.leden_page, page_size=PAGE_SIZE_LEDEN)
+    return render_template(
+        "leden.html", leden=dict_page["items"], next=dict_page["next"]
+    )
+
+
+@app.route("/api/leden")
+@page_cache.cached
+def api_leden():
+    dict_page = read_page(db_reader.leden_page, page_size=PAGE_SIZE_LEDEN)
+    return json_page(dict_page, template="_leden.html", name="leden")
 
 
 @app.route("/voorstellingen")
+@page_cache.cached
 def view_voorstellingen():
     """Page for viewing uitvoeringen"""
-    lst_voorstelling = db_reader.voorstellingen()
-    return render_template("voorstellingen.html", voorstellingen=lst_voorstelling)
+    dict_page = read_page(
+        db_reader.voorstellingen_page, page_size=PAGE_SIZE_VOORSTELLINGEN
+    )
+    return render_template(
+        "voorstellingen.html",
+        voorstellingen=dict_page["items"],
+        next=dict_page["next"],
+    )
+
+
+@app.route("/api/voorstellingen")
+@page_cache.cached
+def api_voorstellingen():
+    dict_page = read_page(
+        db_reader.voorstellingen_page, page_size=PAGE_SIZE_VOORSTELLINGEN
+    )
+    return json_page(dict_page, template="_voorstellingen.html", name="voorstellingen")
 
 
 @app.route("/tijdslijn")
+@page_cache.cached
 def view_tijdslijn():
     """Page for viewing jaren"""
-    lst_timeline = db_reader.timeline()
-    return render_template("tijdslijn.html", tijdslijn=lst_timeline)
+    dict_page = read_page(db_reader.timeline_page, page_size=PAGE_SIZE_JAREN)
+    return render_template(
+        "tijdslijn.html", tijdslijn=dict_page["items"], next=dict_page["next"]
+    )
+
+
+@app.route("/api/tijdslijn")
+@page_cache.cached
+def api_tijdslijn():
+    dict_page = read_page(db_reader.timeline_page, page_size=PAGE_SIZE_JAREN)
+    return json_page(dict_page, template="_tijdslijn.html", name="tijdslijn")
+
+
+@app.route("/zoek")
+def zoek():
+    """Zoeken in leden, voorstellingen en rollen"""
+    query = request.args.get("q", "")
+    return render_template(
+        "zoek.html",
+        title="Zoeken",
+        query=query,
+        resultaten=db_reader.zoek(query, limit=ZOEK_RESULTATEN),
+    )
+
+
+@app.route("/api/zoek")
+def api_zoek():
+    query = request.args.get("q", "")
+    limit = request.args.get("limit", default=ZOEK_AUTOCOMPLETE, type=int)
+    limit = max(1, min(limit, PAGE_SIZE_MAX))
+    return jsonify({"query": query, "items": db_reader.zoek(query, limit=limit)})
 
 
 @app.route("/lid_media/<lid>")
+@page_cache.cached
 def lid_media(lid: str):
     """Page for member photos"""
-    logger.info(f"Leden media voor {lid}")
-    lst_media = db_reader.lid_media(id_lid=lid)
-    dict_lid = db_reader.lid_info(id_lid=lid)
-    return render_template("lid_media.html", lid=dict_lid, media=lst_media)
+    logger.info("Leden media voor %s", lid)
+    results = db_reader.gather(
+        {
+            "lid": lambda: db_reader.lid_info(id_lid=lid),
+            "media": lambda: db_reader.lid_media(id_lid=lid),
+        }
+    )
+    if results["lid"] is None:
+        abort(404)
+    return render_template("lid_media.html", lid=results["lid"], media=results["media"])
 
 
 @app.route("/voorstelling_media/<voorstelling>")
+@page_cache.cached
 def voorstelling_media(voorstelling: str):
     """Page for member media"""
-    dict_voorstelling = db_reader.voorstelling_info(voorstelling=voorstelling)
-    lst_media = db_reader.voorstelling_media(voorstelling=voorstelling)
-    logger.info(f"Get media voor voorstelling {voorstelling}")
+    results = db_reader.gather(
+        {
+            "voorstelling": lambda: db_reader.voorstelling_info(
+                voorstelling=voorstelling
+            ),
+            "media": lambda: db_reader.voorstelling_media(voorstelling=voorstelling),
+        }
+    )
+    if results["voorstelling"] is None:
+        abort(404)
+    logger.info("Get media voor voorstelling %s", voorstelling)
 
     return render_template(
-        "voorstelling_media.html", voorstelling=dict_voorstelling, media=lst_media
+        "voorstelling_media.html",
+        voorstelling=results["voorstelling"],
+        media=results["media"],
     )
 
 @app.route("/voorstelling_lid_media/<voorstelling>/<lid>")
+@page_cache.cached
 def voorstelling_lid_media(voorstelling: str, lid: str):
     """Page for member media for a voorstelling"""
-    dict_voorstelling = db_reader.voorstelling_info(voorstelling=voorstelling)
-    lst_media = db_reader.voorstelling_lid_media(voorstelling=voorstelling, lid=lid)
-    logger.info(f"Get media voor voorstelling {voorstelling} van {lid}")
+    results = db_reader.gather(
+        {
+            "voorstelling": lambda: db_reader.voorstelling_info(
+                voorstelling=voorstelling
+            ),
+            "media": lambda: db_reader.voorstelling_lid_media(
+                voorstelling=voorstelling, lid=lid
+            ),
+        }
+    )
+    if results["voorstelling"] is None:
+        abort(404)
+    logger.info("Get media voor voorstelling %s van %s", voorstelling, lid)
     return render_template(
-        "voorstelling_media.html", voorstelling=dict_voorstelling, media=lst_media
+        "voorstelling_media.html",
+        voorstelling=results["voorstelling"],
+        media=results["media"],
     )
 
+@app.errorhandler(TimeoutError)
+def database_timeout(error):
+    logger.error("Database reageert niet binnen de timeout: %s", request.path)
+    return "De database reageert niet, probeer het later opnieuw", 503
+
+
 @app.route("/about")
 def about():
     """About page"""
@@ -0,0 +1,102 @@
+"""Controleert met EXPLAIN dat de zoekvragen van KnaDB indexen gebruiken
+
+De leesmethoden van de detailpagina's worden uitgevoerd met sleutels uit de
+database; de SQL die daarbij wordt verstuurd, wordt vastgelegd en de database
+toont voor elke zoekvraag het plan. Bij een volledige table scan eindigt het
+script met exit code 1. Overzichtspagina's (leden, voorstellingen, tijdslijn)
+lezen bewust hele tabellen en worden niet gecontroleerd.
+
+Gebruik: python explain_queries.py, met dezelfde KNA_BACKEND en KNA_SQLITE als de
+app (met --debug voor MariaDB op 127.0.0.1).
+"""
+
+import argparse
+import os
+import sys
+
+from sqlalchemy import event
+
+from data_reader import KnaDB
+
+
+def sample_keys(db_reader: KnaDB) -> dict:
+    """Lid en voorstelling met media, om de detail methoden mee uit te voeren"""
+    sql_statement = """
+    SELECT fl.lid, fl.ref_uitvoering
+    FROM file_leden fl
+    INNER JOIN lid l
+    ON l.id_lid = fl.lid
+    WHERE l.gdpr_permission = 1 AND l.Achternaam IS NOT NULL
+    """
+    return db_reader.fetch_one(sql_statement)
+
+
+def capture_statements(db_reader: KnaDB, keys: dict) -> list:
+    lst_statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        lst_statements.append((statement, parameters))
+
+    db_reader.refresh(force=True)
+    event.listen(db_reader.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        db_reader.lid_info(id_lid=keys["lid"])
+        db_reader.lid_media(id_lid=keys["lid"])
+        db_reader.voorstelling_info(voorstelling=keys["ref_uitvoering"])
+        db_reader.voorstelling_media(voorstelling=keys["ref_uitvoering"])
+        db_reader.voorstelling_thumbnail(voorstelling=keys["ref_uitvoering"])
+        db_reader.voorstelling_lid_media(
+            voorstelling=keys["ref_uitvoering"], lid=keys["lid"]
+        )
+    finally:
+        event.remove(
+            db_reader.engine, "before_cursor_execute", before_cursor_execute
+        )
+    return lst_statements
+
+
+def full_scans(connection, statement: str, parameters) -> list:
+    """Tabellen die in het plan van een zoekvraag volledig worden gelezen"""
+    if connection.dialect.name == "sqlite":
+        result = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+        return [row[-1] for row in result if row[-1].startswith("SCAN ")]
+    result = connection.exec_driver_sql("EXPLAIN " + statement, parameters)
+    return [
+        f"{row['table']} (type {row['type']})"
+        for row in result.mappings()
+        if row["type"] in ("ALL", "index")
+    ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Controleert de KnaDB query plannen")
+    parser.add_argument("--debug", action="store_true", help="MariaDB op 127.0.0.1")
+    args = parser.parse_args()
+
+    db_reader = KnaDB(
+        dir_resources="/data/resources/",
+        debug=args.debug,
+        snapshot_interval=3600,
+        backend=os.environ.get("KNA_BACKEND", "mariadb"),
+        file_sqlite=os.environ.get("KNA_SQLITE"),
+    )
+    keys = sample_keys(db_reader)
+    if keys is None:
+        print("Geen lid met media gevonden, niets te controleren")
+        return 1
+
+    qty_scans = 0
+    lst_statements = capture_statements(db_reader, keys)
+    with db_reader.engine.connect() as connection:
+        for statement, parameters in lst_statements:
+            lst_scans = full_scans(connection, statement, parameters)
+            if len(lst_scans) > 0:
+                qty_scans = qty_scans + 1
+                print("Volledige scan: " + ", ".join(lst_scans))
+                print(statement)
+    print(f"{len(lst_statements)} zoekvragen gecontroleerd, {qty_scans} met scan")
+    return 0 if qty_scans == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,379 @@
+"""Statische export van de pagina's van de web-app, om door NGINX te laten serveren
+
+Alle pagina's (overzichten, leden, voorstellingen, leden per voorstelling en de
+afbeelding-, video- en PDF-pagina's) worden gerenderd naar <pad>.html in een
+nieuwe directory per export, <generatie>-<tijdstip> in de site directory. Pas
+als de export compleet is, wijst de link 'current' daarnaar; NGINX serveert de
+bestanden onder current en stuurt de rest (/cdn, /zoek, /api, requests met
+query parameters, pagina's die niet in de export staan) door naar de app.
+
+Het laadscript haalt de link weg zodra het een nieuwe data generatie publiceert
+(zie data_loader/publish.py); tot de volgende export gaan alle pagina's dan naar
+de app. Een export die tijdens het laden van nieuwe data is gemaakt, wordt niet
+gepubliceerd.
+
+Per pagina wordt in export.json een vingerafdruk bewaard: de versie van de code
+en templates van de app, de leesmethoden van KnaDB die de pagina aanriep met een
+hash van hun resultaten en de media die de pagina gebruikt (pad en manifest
+regel). Bij een volgende export voert een pool van processen per pagina die
+leesmethoden opnieuw uit; is de vingerafdruk gelijk gebleven, dan wordt de pagina
+zonder te renderen overgenomen uit de vorige export (als harde link), anders
+opnieuw gerenderd. Een gewijzigd lid raakt zo alleen de pagina's die dat lid
+tonen. Pagina's die niet meer bestaan, komen niet in de nieuwe export.
+
+Te starten na load_data.py, met dezelfde omgeving als de app:
+python export.py [--output /data/resources/site]
+"""
+
+import argparse
+import functools
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from urllib.parse import quote, unquote
+
+# Pagina's niet in het geheugen van de export bewaren
+os.environ["KNA_PAGE_CACHE_MB"] = "0"
+
+import app as web  # noqa: E402
+from data_reader import IMAGE_EXTENSIONS  # noqa: E402
+
+DIR_APP = os.path.dirname(os.path.abspath(__file__))
+FILE_EXPORT = "export.json"
+# Link naar de gepubliceerde export, zie nginx-https.conf.template
+SITE_CURRENT = "current"
+
+_current = {}
+_local = threading.local()
+_readers = {}
+
+
+def code_version() -> str:
+    """Hash van de code, templates en afbeeldingen van de app"""
+    sha1 = hashlib.sha1()
+    for dir, dirs, files in os.walk(DIR_APP):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        for file in sorted(files):
+            if dir == DIR_APP and not file.endswith(".py"):
+                continue
+            path = os.path.join(dir, file)
+            sha1.update(os.path.relpath(path, DIR_APP).encode("utf-8"))
+            with open(path, "rb") as f:
+                sha1.update(f.read())
+    return sha1.hexdigest()
+
+
+def read_hash(result) -> str:
+    text = json.dumps(result, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def data_hash(dict_reads: dict) -> str:
+    """Hash van de resultaten van de leesmethoden van een pagina, onafhankelijk
+    van de volgorde van aanroepen"""
+    text = "\n".join(f"{key}={dict_reads[key]}" for key in sorted(dict_reads))
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def replay_reads(lst_reads: list) -> str:
+    """Voert de opgeslagen leesmethoden van een pagina opnieuw uit, zie data_hash"""
+    dict_reads = {}
+    for name, args, kwargs in lst_reads:
+        result = _readers[name](*args, **kwargs)
+        dict_reads[json.dumps([name, args, kwargs])] = read_hash(result)
+    return data_hash(dict_reads)
+
+
+def media_state(id_media: str) -> dict:
+    """Pad en manifest regel van een medium; zonder regel in het manifest de
+    versie uit grootte en mtime (zie media_version)"""
+    path = _readers["media_path"](id_media=id_media)
+    if path is None:
+        return None
+    info = _readers["file_info"](path)
+    if info is None:
+        return {"path": path, "version": web.file_version(path)}
+    return {"path": path, **info}
+
+
+def page_urls() -> list:
+    """URL's van alle pagina's die vanuit de overzichten bereikbaar zijn"""
+    db_reader = web.db_reader
+    lst_urls = ["/", "/about", "/leden", "/voorstellingen", "/tijdslijn"]
+    set_pairs = set()
+    for lid in db_reader.leden():
+        lst_urls.append(f"/lid_media/{quote(lid['id_lid'])}")
+        for uitvoering in lid["uitvoeringen"]:
+            set_pairs.add((uitvoering["ref_uitvoering"], lid["id_lid"]))
+    for voorstelling in db_reader.voorstellingen():
+        lst_urls.append(f"/voorstelling_media/{quote(voorstelling['ref_uitvoering'])}")
+        for rol in voorstelling["rollen"]:
+            set_pairs.add((rol["ref_uitvoering"], rol["id_lid"]))
+    lst_urls.extend(
+        f"/voorstelling_lid_media/{quote(voorstelling)}/{quote(lid)}"
+        for voorstelling, lid in sorted(set_pairs)
+        if voorstelling is not None and lid is not None
+    )
+    for file in db_reader.fetch_all("SELECT id_file, file_ext FROM file"):
+        if file["file_ext"] in IMAGE_EXTENSIONS:
+            lst_urls.append(f"/image/{quote(str(file['id_file']))}")
+        elif file["file_ext"] == "mp4":
+            lst_urls.append(f"/video/{quote(str(file['id_file']))}")
+        elif file["file_ext"] == "pdf":
+            lst_urls.append(f"/pdf/{quote(str(file['id_file']))}")
+    return list(dict.fromkeys(lst_urls))
+
+
+def page_file(url: str) -> str:
+    """Bestand van een pagina relatief in de export, None bij een onveilig pad"""
+    if url == "/":
+        return "index.html"
+    lst_parts = [unquote(part) for part in url.strip("/").split("/")]
+    for part in lst_parts:
+        if part in ("", ".", "..") or "/" in part or "\0" in part:
+            return None
+    return os.path.join(*lst_parts) + ".html"
+
+
+def page_unchanged(previous: dict, file: str, code: str, dir_previous: str) -> bool:
+    """Of een pagina uit de vorige export ongewijzigd kan worden overgenomen"""
+    if previous is None or dir_previous is None:
+        return False
+    if previous["file"] != file or previous["code"] != code:
+        return False
+    if not os.path.exists(os.path.join(dir_previous, file)):
+        return False
+    for id_media, state in previous["media"].items():
+        if media_state(id_media) != state:
+            return False
+    try:
+        return replay_reads(previous["reads"]) == previous["data"]
+    except Exception:
+        return False
+
+
+def copy_page(path_from: str, path_to: str) -> None:
+    os.makedirs(os.path.dirname(path_to), exist_ok=True)
+    try:
+        os.link(path_from, path_to)
+    except OSError:
+        shutil.copyfile(path_from, path_to)
+
+
+def record_reader(name: str):
+    """Vervangt een leesmethode door een versie die de aanroepen van een pagina
+    vastlegt; aanroepen vanuit een andere leesmethode tellen niet mee"""
+    method = _readers[name]
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_local, "depth", 0)
+        _local.depth = depth + 1
+        try:
+            result = method(*args, **kwargs)
+        finally:
+            _local.depth = depth
+        if depth == 0 and "reads" in _current:
+            key = json.dumps([name, list(args), kwargs])
+            _current["reads"][key] = read_hash(result)
+        return result
+
+    setattr(web.db_reader, name, wrapper)
+
+
+def record_media_path(id_media: str, webp: bool = False) -> str:
+    # Media die de templates gebruiken (URL's met versie, afmetingen)
+    if "media" in _current:
+        _current["media"][id_media] = media_state(id_media)
+    return _readers["media_path"](id_media=id_media, webp=webp)
+
+
+def init_worker(dir_export: str, dir_previous: str, code: str) -> None:
+    web.db_reader.after_fork()
+    web.app.testing = True
+    for name in web.READERS + ["media_path", "file_info"]:
+        _readers[name] = getattr(web.db_reader, name)
+    for name in web.READERS:
+        record_reader(name)
+    web.db_reader.media_path = record_media_path
+    _current.update(dir_export=dir_export, dir_previous=dir_previous, code=code)
+
+
+def render_page(url: str, file: str) -> tuple:
+    """Rendert een pagina; geeft (status, vingerafdruk) terug"""
+    _current.update(reads={}, media={})
+    try:
+        response = web.app.test_client().get(url)
+    finally:
+        dict_reads = _current.pop("reads")
+        dict_media = _current.pop("media")
+    if response.status_code != 200:
+        return f"status {response.status_code}", None
+    path = os.path.join(_current["dir_export"], file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(response.get_data())
+    fingerprint = {
+        "file": file,
+        "code": _current["code"],
+        "reads": [json.loads(key) for key in sorted(dict_reads)],
+        "data": data_hash(dict_reads),
+        "media": dict_media,
+    }
+    return "gerenderd", fingerprint
+
+
+def export_page(task: tuple) -> tuple:
+    """Neemt een pagina over uit de vorige export of rendert hem opnieuw; geeft
+    (url, status, vingerafdruk) terug"""
+    url, file, previous = task
+    dir_previous = _current["dir_previous"]
+    if page_unchanged(previous, file, _current["code"], dir_previous):
+        copy_page(
+            os.path.join(dir_previous, file),
+            os.path.join(_current["dir_export"], file),
+        )
+        return url, "ongewijzigd", previous
+    status, fingerprint = render_page(url, file)
+    return url, status, fingerprint
+
+
+def export_pages(
+    lst_tasks: list, workers: int, initargs: tuple, dict_status: dict
+) -> dict:
+    """Vingerafdrukken van de geëxporteerde pagina's per URL"""
+    # Workers via fork, zodat snapshot en gedeeld bestand al geopend zijn
+    dict_pages = {}
+    if len(lst_tasks) == 0:
+        return dict_pages
+    context = multiprocessing.get_context("fork")
+    with context.Pool(
+        processes=workers, initializer=init_worker, initargs=initargs
+    ) as pool:
+        for url, status, fingerprint in pool.imap_unordered(
+            export_page, lst_tasks, chunksize=16
+        ):
+            dict_status[status] = dict_status.get(status, 0) + 1
+            if fingerprint is not None:
+                dict_pages[url] = fingerprint
+    return dict_pages
+
+
+def previous_export(output: str) -> tuple:
+    """Directory en pagina's van de laatste export, of (None, {})
+
+    Ook wanneer het laadscript de link current al heeft weggehaald, dient de
+    laatste export als basis; de vingerafdrukken bepalen wat nog klopt.
+    """
+    lst_exports = []
+    for entry in os.listdir(output):
+        file_export = os.path.join(output, entry, FILE_EXPORT)
+        if not os.path.islink(os.path.join(output, entry)) and os.path.exists(
+            file_export
+        ):
+            lst_exports.append((os.stat(file_export).st_mtime_ns, entry))
+    if len(lst_exports) == 0:
+        return None, {}
+    dir_previous = os.path.join(output, max(lst_exports)[1])
+    with open(os.path.join(dir_previous, FILE_EXPORT)) as file:
+        return dir_previous, json.load(file)["pages"]
+
+
+def publish(output: str, name: str) -> None:
+    """Laat de link current in een keer naar de export wijzen"""
+    link = os.path.join(output, SITE_CURRENT)
+    os.symlink(name, link + ".tmp")
+    os.replace(link + ".tmp", link)
+
+
+def remove_old_exports(output: str, name: str) -> None:
+    for entry in os.listdir(output):
+        path = os.path.join(output, entry)
+        if entry == name or os.path.islink(path) or not os.path.isdir(path):
+            continue
+        if os.path.exists(os.path.join(path, FILE_EXPORT)):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def export(output: str, workers: int = None, force: bool = False) -> dict:
+    time_start = time.perf_counter()
+    db_reader = web.db_reader
+    db_reader.refresh()
+    generation = db_reader.generation
+    if generation is None:
+        print("Export: geen data generatie in de database, niets geëxporteerd")
+        return {}
+    os.makedirs(output, exist_ok=True)
+    dir_previous, dict_previous = previous_export(output)
+    if force:
+        dict_previous = {}
+    dir_export = tempfile.mkdtemp(
+        prefix=f"{generation[:16]}-{time.strftime('%Y%m%d%H%M%S')}-", dir=output
+    )
+    os.chmod(dir_export, 0o755)
+    name = os.path.basename(dir_export)
+
+    lst_urls = page_urls()
+    dict_status = {}
+    lst_tasks = []
+    for url in lst_urls:
+        file = page_file(url)
+        if file is None:
+            dict_status["overgeslagen"] = dict_status.get("overgeslagen", 0) + 1
+            continue
+        lst_tasks.append((url, file, dict_previous.get(url)))
+
+    workers = workers or os.cpu_count()
+    print(
+        f"Export: {len(lst_urls)} pagina's met {workers} processen naar {dir_export}"
+    )
+    try:
+        dict_pages = export_pages(
+            lst_tasks,
+            workers=workers,
+            initargs=(dir_export, dir_previous, code_version()),
+            dict_status=dict_status,
+        )
+        with open(os.path.join(dir_export, FILE_EXPORT), "w") as file:
+            json.dump({"generation": generation, "pages": dict_pages}, file)
+    except BaseException:
+        shutil.rmtree(dir_export, ignore_errors=True)
+        raise
+
+    # Niet publiceren wanneer er intussen een nieuwe data generatie is geladen; de
+    # controle na het publiceren vangt een lading die tegelijk klaar was
+    if db_reader.data_generation() == generation:
+        publish(output, name)
+    if db_reader.data_generation() != generation:
+        link = os.path.join(output, SITE_CURRENT)
+        if os.path.realpath(link) == os.path.realpath(dir_export):
+            os.remove(link)
+        shutil.rmtree(dir_export, ignore_errors=True)
+        print("Export: intussen is er nieuwe data geladen, export niet gepubliceerd")
+        return dict_status
+    remove_old_exports(output, name)
+
+    duration = time.perf_counter() - time_start
+    print(
+        f"Export klaar in {duration:.1f}s: "
+        + ", ".join(f"{qty} {status}" for status, qty in dict_status.items())
+    )
+    return dict_status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Statische export van de web-app")
+    parser.add_argument("--output", default="/data/resources/site")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Aantal processen (standaard: cores)"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Alle pagina's opnieuw renderen"
+    )
+    args = parser.parse_args()
+    export(output=args.output, workers=args.workers, force=args.force)
@@ -0,0 +1,40 @@
+"""Gunicorn configuratie van de web-app
+
+Standaard een worker per beschikbare core, elk met een aantal threads (gthread),
+zodat een trage pagina of een lange download via /cdn de andere bezoekers niet
+ophoudt. Met KNA_WORKER_CLASS=gevent worden gevent workers gebruikt (vereist het
+pakket gevent). Met KNA_PRELOAD=1 wordt de app een keer in de master geladen,
+inclusief snapshot, en starten de workers daar via fork vanuit; elke worker maakt
+daarna zijn eigen databaseverbindingen (zie KnaDB.after_fork). Media register,
+manifest en zoekindex lezen alle workers uit hetzelfde gedeelde bestand.
+
+Instellingen: KNA_BIND, KNA_WORKERS, KNA_THREADS, KNA_WORKER_CLASS, KNA_PRELOAD,
+KNA_WORKER_TIMEOUT.
+"""
+
+import os
+
+
+def available_cores() -> int:
+    # Rekening houden met een beperking tot een deel van de cores (container, taskset)
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = os.environ.get("KNA_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("KNA_WORKERS", available_cores()))
+worker_class = os.environ.get("KNA_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("KNA_THREADS", "4"))
+preload_app = os.environ.get("KNA_PRELOAD", "1") == "1"
+timeout = int(os.environ.get("KNA_WORKER_TIMEOUT", "60"))
+keepalive = 5
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+    from app import db_reader
+
+    db_reader.after_fork()
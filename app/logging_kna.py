@@ -1,13 +1,208 @@
+"""Logging van de web-app: JSON regels via een achtergrond thread
+
+Log records gaan als JSON regel via een begrensde queue naar een writer thread
+die ze naar stdout schrijft; een request wacht zo nooit op stdout. Is de
+queue vol, dan worden records weggegooid en geteld. Elke regel krijgt het
+request ID van het request waarin gelogd wordt (X-Request-ID, zie init_app).
+
+Records onder WARNING worden per bericht (de format string) begrensd tot
+KNA_LOG_RATE per seconde; DEBUG records kunnen worden gesampled met
+KNA_LOG_SAMPLE (fractie die wordt gehouden). Het aantal onderdrukte records
+staat bij het eerstvolgende record van hetzelfde bericht.
+
+Het niveau is per subsysteem in te stellen (logger KNA.<subsysteem>), met
+KNA_LOG_LEVELS="db=DEBUG,cdn=WARNING" of tijdens het draaien via het bestand
+KNA_LOG_CONFIG, met dezelfde notatie; wijzigingen daarin worden binnen
+LEVELS_INTERVAL seconden door elk proces opgepakt.
+"""
+
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
 from sys import stdout
 
+from flask import Flask, Response, request
+
+QUEUE_SIZE = int(os.environ.get("KNA_LOG_QUEUE", "10000"))
+LOG_RATE = float(os.environ.get("KNA_LOG_RATE", "20"))
+LOG_SAMPLE = float(os.environ.get("KNA_LOG_SAMPLE", "1"))
+LOG_LEVELS = os.environ.get("KNA_LOG_LEVELS", "")
+LOG_CONFIG = os.environ.get("KNA_LOG_CONFIG")
+LEVELS_INTERVAL = 5
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+# Attributen die elk LogRecord heeft; de rest komt van extra={...}
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def get_logger(subsystem: str) -> logging.Logger:
+    return logging.getLogger("KNA." + subsystem)
+
+
+def set_levels(levels: str) -> None:
+    """Niveaus per subsysteem: 'db=DEBUG,cdn=WARNING'; '*' is de KNA logger zelf"""
+    for setting in re.split(r"[,\s]+", levels.strip()):
+        if "=" not in setting:
+            continue
+        subsystem, level = setting.split("=", 1)
+        name = "KNA" if subsystem == "*" else "KNA." + subsystem
+        logging.getLogger(name).setLevel(level.upper())
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        dict_record = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "location": f"{record.filename}:{record.funcName}:{record.lineno}",
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and value is not None:
+                dict_record[key] = value
+        if record.exc_info:
+            dict_record["exception"] = self.formatException(record.exc_info)
+        return json.dumps(dict_record, default=str, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """Request ID toevoegen, en records onder WARNING begrenzen en samplen"""
+
+    def __init__(self, rate: float = LOG_RATE, sample: float = LOG_SAMPLE) -> None:
+        super().__init__()
+        self.rate = rate
+        self.sample = sample
+        self.buckets = {}  # (logger, bericht) -> [tokens, tijd, onderdrukt]
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        if record.levelno >= logging.WARNING:
+            return True
+        if record.levelno <= logging.DEBUG and random.random() >= self.sample:
+            return False
+        if self.rate <= 0:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) > 10000:
+                    self.buckets.clear()
+                bucket = self.buckets[key] = [self.rate, now, 0]
+            bucket[0] = min(self.rate, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] = bucket[2] + 1
+                return False
+            bucket[0] = bucket[0] - 1
+            if bucket[2] > 0:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Gooit records weg wanneer de queue vol is, in plaats van te wachten"""
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if self.dropped > 0:
+            record.dropped = self.dropped
+        return super().prepare(record)
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+            self.dropped = 0
+        except queue.Full:
+            self.dropped = self.dropped + 1
+
+
+def _watch_levels() -> None:
+    """Past de niveaus aan wanneer het bestand KNA_LOG_CONFIG wijzigt"""
+    mtime_previous = None
+    while True:
+        try:
+            mtime = os.stat(LOG_CONFIG).st_mtime_ns
+            if mtime != mtime_previous:
+                mtime_previous = mtime
+                with open(LOG_CONFIG) as file:
+                    set_levels(file.read())
+        except OSError:
+            pass
+        time.sleep(LEVELS_INTERVAL)
+
+
+def _start_listener() -> None:
+    """Nieuwe queue en threads; ook na een fork, waar de threads ontbreken"""
+    global _listener
+    queue_handler.queue = queue.Queue(maxsize=QUEUE_SIZE)
+    _listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler)
+    _listener.start()
+    if LOG_CONFIG is not None:
+        thread = threading.Thread(target=_watch_levels, name="kna-log-levels")
+        thread.daemon = True
+        thread.start()
+
+
+# De JSON regel wordt in de aanroepende thread gemaakt, het schrijven naar stdout
+# gebeurt in de writer thread
+stream_handler = logging.StreamHandler(stdout)
+stream_handler.setFormatter(logging.Formatter("%(message)s"))
+queue_handler = DroppingQueueHandler(queue.Queue(maxsize=QUEUE_SIZE))
+queue_handler.setFormatter(JsonFormatter())
+queue_handler.addFilter(RateLimitFilter())
+
 # Define logger
 logger = logging.getLogger("KNA")
+logger.setLevel(logging.INFO)
+logger.addHandler(queue_handler)
+logger.propagate = False
+set_levels(LOG_LEVELS)
+
+_listener = None
+_start_listener()
+os.register_at_fork(after_in_child=_start_listener)
+
+
+# Bij het afsluiten de queue nog leegschrijven
+atexit.register(lambda: _listener.stop())
+
+
+def init_app(app: Flask) -> None:
+    """Request ID per request: uit X-Request-ID (bijvoorbeeld van NGINX) of nieuw"""
+
+    def _before_request():
+        value = request.headers.get("X-Request-ID", "")
+        if not re.fullmatch(r"[A-Za-z0-9._-]{1,64}", value):
+            value = uuid.uuid4().hex[:16]
+        request_id.set(value)
+
+    def _after_request(response: Response) -> Response:
+        value = request_id.get()
+        if value is not None:
+            response.headers["X-Request-ID"] = value
+        return response
 
-logger.setLevel(logging.INFO)  # set logger level
-logFormatter = logging.Formatter(
-    "%(name)-12s %(asctime)s %(levelname)-8s %(filename)s:%(funcName)s %(message)s"
-)
-consoleHandler = logging.StreamHandler(stdout)  # set streamhandler to stdout
-consoleHandler.setFormatter(logFormatter)
-logger.addHandler(consoleHandler)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(lambda error: request_id.set(None))
@@ -0,0 +1,226 @@
+"""Meten van requests: SQL, KnaDB methoden, templates, /cdn bytes en page cache
+
+Per request worden het aantal queries en de tijd in SQL, in KnaDB methoden en
+in het renderen van templates bijgehouden en als Server-Timing header
+meegestuurd. Daarnaast worden totalen en een histogram van de duur per route
+bijgehouden, die via /metrics in Prometheus formaat beschikbaar zijn. De
+tellers staan in het geheugen van het proces; met meerdere gunicorn workers
+toont /metrics de tellers van de worker die de scrape afhandelt.
+"""
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Flask, Response, before_render_template, g, has_request_context
+from flask import request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Grenzen van de histogram buckets in seconden
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+_lock = threading.Lock()
+_requests = {}  # (route, methode, status) -> aantal
+_durations = {}  # route -> [aantal per bucket, som, aantal]
+_totals = {
+    "db_queries": 0,
+    "db_seconds": 0.0,
+    "render_seconds": 0.0,
+    "cdn_bytes": 0,
+    "page_cache_hits": 0,
+    "page_cache_misses": 0,
+}
+_readers = {}  # KnaDB methode -> [aantal, som]
+# Diepte van geneste KnaDB methoden per thread; gather voert methoden van hetzelfde
+# request in andere threads uit
+_local = threading.local()
+
+
+def _request_timings() -> dict:
+    if not has_request_context():
+        return None
+    if "kna_timings" not in g:
+        g.kna_timings = {
+            "db": 0.0,
+            "queries": 0,
+            "reader": 0.0,
+            "render": 0.0,
+        }
+    return g.kna_timings
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    conn.info.setdefault("kna_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    duration = time.perf_counter() - conn.info["kna_query_start"].pop()
+    timings = _request_timings()
+    with _lock:
+        _totals["db_queries"] += 1
+        _totals["db_seconds"] += duration
+        if timings is not None:
+            timings["queries"] += 1
+            timings["db"] += duration
+
+
+def _handle_error(exception_context):
+    # Een mislukte query krijgt geen after_cursor_execute; het starttijdstip toch
+    # weghalen, anders blijft het achter op de verbinding in de pool
+    if (
+        exception_context.connection is None
+        or exception_context.execution_context is None
+    ):
+        return
+    lst_starts = exception_context.connection.info.get("kna_query_start")
+    if lst_starts:
+        lst_starts.pop()
+
+
+def _before_render_template(sender, template, context, **extra):
+    timings = _request_timings()
+    if timings is not None:
+        timings["render_start"] = time.perf_counter()
+
+
+def _template_rendered(sender, template, context, **extra):
+    timings = _request_timings()
+    if timings is None or "render_start" not in timings:
+        return
+    duration = time.perf_counter() - timings.pop("render_start")
+    timings["render"] += duration
+    with _lock:
+        _totals["render_seconds"] += duration
+
+
+def instrument_reader(db_reader, methods: list) -> None:
+    """Meet de duur van de opgegeven methoden van een KnaDB object"""
+    for name in methods:
+        method = getattr(db_reader, name)
+
+        @functools.wraps(method)
+        def wrapper(*args, method=method, name=name, **kwargs):
+            timings = _request_timings()
+            _local.depth = getattr(_local, "depth", 0) + 1
+            time_start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - time_start
+                with _lock:
+                    reader = _readers.setdefault(name, [0, 0.0])
+                    reader[0] += 1
+                    reader[1] += duration
+                    # Methoden die elkaar aanroepen maar een keer meetellen
+                    _local.depth -= 1
+                    if timings is not None and _local.depth == 0:
+                        timings["reader"] += duration
+
+        setattr(db_reader, name, wrapper)
+
+
+def add_cdn_bytes(qty: int) -> None:
+    with _lock:
+        _totals["cdn_bytes"] += qty
+
+
+def add_page_cache(hit: bool) -> None:
+    with _lock:
+        _totals["page_cache_hits" if hit else "page_cache_misses"] += 1
+
+
+def _before_request():
+    g.kna_request_start = time.perf_counter()
+    _request_timings()
+
+
+def _after_request(response: Response) -> Response:
+    duration = time.perf_counter() - g.kna_request_start
+    route = request.url_rule.rule if request.url_rule is not None else "onbekend"
+    with _lock:
+        key = (route, request.method, response.status_code)
+        _requests[key] = _requests.get(key, 0) + 1
+        histogram = _durations.setdefault(route, [[0] * len(BUCKETS), 0.0, 0])
+        index = bisect_left(BUCKETS, duration)
+        if index < len(BUCKETS):
+            histogram[0][index] += 1
+        histogram[1] += duration
+        histogram[2] += 1
+
+    timings = g.kna_timings
+    response.headers["Server-Timing"] = ", ".join(
+        [
+            f'db;dur={timings["db"] * 1000:.1f};desc="{timings["queries"]} queries"',
+            f"reader;dur={timings['reader'] * 1000:.1f}",
+            f"render;dur={timings['render'] * 1000:.1f}",
+            f"total;dur={duration * 1000:.1f}",
+        ]
+    )
+    return response
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def exposition() -> str:
+    """Alle tellers in het tekstformaat van Prometheus"""
+    lines = []
+    with _lock:
+        lines.append("# TYPE kna_requests_total counter")
+        for (route, method, status), qty in sorted(_requests.items()):
+            lines.append(
+                f'kna_requests_total{{route="{_label(route)}",method="{method}",'
+                f'status="{status}"}} {qty}'
+            )
+        lines.append("# TYPE kna_request_duration_seconds histogram")
+        for route, (buckets, total, qty) in sorted(_durations.items()):
+            label = f'route="{_label(route)}"'
+            cumulative = 0
+            for bound, qty_bucket in zip(BUCKETS, buckets):
+                cumulative += qty_bucket
+                lines.append(
+                    f'kna_request_duration_seconds_bucket{{{label},le="{bound}"}}'
+                    f" {cumulative}"
+                )
+            lines.append(
+                f'kna_request_duration_seconds_bucket{{{label},le="+Inf"}} {qty}'
+            )
+            lines.append(f"kna_request_duration_seconds_sum{{{label}}} {total}")
+            lines.append(f"kna_request_duration_seconds_count{{{label}}} {qty}")
+        lines.append("# TYPE kna_db_queries_total counter")
+        lines.append(f"kna_db_queries_total {_totals['db_queries']}")
+        lines.append("# TYPE kna_db_query_seconds_total counter")
+        lines.append(f"kna_db_query_seconds_total {_totals['db_seconds']}")
+        lines.append("# TYPE kna_reader_calls_total counter")
+        for name, (qty, total) in sorted(_readers.items()):
+            lines.append(f'kna_reader_calls_total{{method="{name}"}} {qty}')
+        lines.append("# TYPE kna_reader_seconds_total counter")
+        for name, (qty, total) in sorted(_readers.items()):
+            lines.append(f'kna_reader_seconds_total{{method="{name}"}} {total}')
+        lines.append("# TYPE kna_render_seconds_total counter")
+        lines.append(f"kna_render_seconds_total {_totals['render_seconds']}")
+        lines.append("# TYPE kna_cdn_bytes_total counter")
+        lines.append(f"kna_cdn_bytes_total {_totals['cdn_bytes']}")
+        lines.append("# TYPE kna_page_cache_hits_total counter")
+        lines.append(f"kna_page_cache_hits_total {_totals['page_cache_hits']}")
+        lines.append("# TYPE kna_page_cache_misses_total counter")
+        lines.append(f"kna_page_cache_misses_total {_totals['page_cache_misses']}")
+    return "\n".join(lines) + "\n"
+
+
+def init_app(app: Flask) -> None:
+    """Koppelt de metingen aan de app, de SQLAlchemy engines en /metrics"""
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(exposition(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,97 @@
+"""Cache van gerenderde pagina's, per data generatie
+
+Pagina's veranderen alleen wanneer de loader een nieuwe data generatie
+publiceert. De HTML (of JSON) van een route wordt daarom bewaard onder de route,
+de argumenten en de data generatie; bij een nieuwe generatie wordt de hele cache
+geleegd. De cache is begrensd op het aantal bytes, de langst niet gebruikte
+pagina's vallen als eerste af. Elke pagina krijgt een sterke ETag, zodat een
+browser die de pagina al heeft een 304 krijgt zonder dat er iets wordt gerenderd.
+Net als bij metrics.py heeft elke gunicorn worker een eigen cache.
+"""
+
+import functools
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Response, make_response, request
+
+import metrics
+
+# Maximale omvang van de cache, in MB
+PAGE_CACHE_MB = float(os.environ.get("KNA_PAGE_CACHE_MB", "64"))
+
+_lock = threading.Lock()
+_pages = OrderedDict()  # (route, argumenten) -> (body, mimetype, etag)
+_state = {"generation": None, "bytes": 0, "max_bytes": int(PAGE_CACHE_MB * 1024**2)}
+_db_reader = None
+
+
+def _get(key: tuple) -> tuple:
+    with _lock:
+        page = _pages.get(key)
+        if page is not None:
+            _pages.move_to_end(key)
+        return page
+
+
+def _put(key: tuple, page: tuple) -> None:
+    size = len(page[0])
+    with _lock:
+        if size > _state["max_bytes"] or key in _pages:
+            return
+        _pages[key] = page
+        _state["bytes"] += size
+        while _state["bytes"] > _state["max_bytes"]:
+            _, (body, _, _) = _pages.popitem(last=False)
+            _state["bytes"] -= len(body)
+
+
+def _current_generation() -> str:
+    """Data generatie van de database; bij een nieuwe generatie de cache legen"""
+    _db_reader.refresh()
+    generation = _db_reader.generation
+    with _lock:
+        if generation != _state["generation"]:
+            _pages.clear()
+            _state["bytes"] = 0
+            _state["generation"] = generation
+    return generation
+
+
+def cached(view):
+    """Route waarvan het antwoord per data generatie wordt bewaard"""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        generation = _current_generation()
+        # Zonder data generatie is niet te zien wanneer de data wijzigt
+        if generation is None:
+            return view(*args, **kwargs)
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        page = _get(key)
+        metrics.add_page_cache(hit=page is not None)
+        if page is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.direct_passthrough:
+                return response
+            body = response.get_data()
+            etag = hashlib.sha1(generation.encode("utf-8") + body).hexdigest()
+            page = (body, response.mimetype, etag)
+            # Niet bewaren als er intussen een nieuwe generatie is gepubliceerd
+            if _state["generation"] == generation:
+                _put(key, page)
+        body, mimetype, etag = page
+        response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    return wrapper
+
+
+def set_reader(db_reader) -> None:
+    """Koppelt de cache aan de KnaDB waarvan de data generatie wordt gevolgd"""
+    global _db_reader
+    _db_reader = db_reader
@@ -0,0 +1,204 @@
+"""Zoekindex over leden, rollen en voorstellingen
+
+Een inverted index van genormaliseerde woorden (kleine letters, zonder accenten)
+naar documenten, als tabellen in het gedeelde SQLite bestand (shared_file.py).
+Per woord staan de documentnummers samen in één rij (een posting list), zodat een
+woord dat in duizenden documenten voorkomt toch maar één rij is om te lezen.
+Elk woord van de zoekvraag zoekt op begin van woorden, zodat de index ook voor
+autocomplete bruikbaar is; een document moet alle woorden bevatten.
+Tussenvoegsels in de zoekvraag tellen niet mee, tenzij de zoekvraag alleen uit
+tussenvoegsels bestaat. Achternamen met tussenvoegsel zijn ook als een woord te
+vinden ('vanderberg').
+"""
+
+import array
+import functools
+import heapq
+import re
+import unicodedata
+
+# Tussenvoegsels van Nederlandse achternamen
+TUSSENVOEGSELS = set(
+    "d de den der des du het in la le op s t te ten ter van von".split()
+)
+
+# Volgorde van de soorten documenten bij gelijke relevantie
+DOCUMENT_TYPES = ["lid", "voorstelling", "rol"]
+
+# Korte begins komen bij autocomplete vaak voor en leveren veel woorden op; tot
+# deze lengte staan de documenten per begin in een eigen tabel
+PREFIX_LENGTH = 3
+
+
+@functools.lru_cache(maxsize=65536)
+def normalize(text: str) -> str:
+    """Kleine letters zonder accenten: 'Pénélope' -> 'penelope'"""
+    text = str(text)
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return text.casefold()
+
+
+def words(text) -> list:
+    if text is None:
+        return []
+    return re.findall(r"\w+", normalize(text))
+
+
+def query_words(query: str) -> list:
+    lst_words = words(query)
+    lst_significant = [word for word in lst_words if word not in TUSSENVOEGSELS]
+    return lst_significant if len(lst_significant) > 0 else lst_words
+
+
+def pack(lst_ids) -> bytes:
+    return array.array("i", sorted(lst_ids)).tobytes()
+
+
+def unpack(postings: bytes) -> array.array:
+    lst_ids = array.array("i")
+    lst_ids.frombytes(postings)
+    return lst_ids
+
+
+def write_index(connection, lst_documents: list) -> None:
+    """Schrijft de index over documenten met 'type', 'label', 'detail', 'url' en
+    'text' naar een SQLite database
+
+    'text' is een lijst van teksten waarop het document gevonden wordt; met
+    'achternaam' wordt de achternaam ook aaneengeschreven geïndexeerd.
+    """
+    lst_documents = sorted(
+        lst_documents,
+        key=lambda d: (DOCUMENT_TYPES.index(d["type"]), normalize(d["label"])),
+    )
+    connection.execute(
+        """CREATE TABLE zoek_document (
+            id_document INTEGER PRIMARY KEY,
+            type TEXT,
+            label TEXT,
+            detail TEXT,
+            url TEXT
+        )"""
+    )
+    connection.execute(
+        """CREATE TABLE zoek_woord (
+            woord TEXT PRIMARY KEY,
+            documenten BLOB
+        ) WITHOUT ROWID"""
+    )
+    connection.execute(
+        """CREATE TABLE zoek_begin (
+            begin TEXT PRIMARY KEY,
+            documenten BLOB
+        ) WITHOUT ROWID"""
+    )
+    # Documenten zijn gesorteerd, een lager nummer komt eerder in de resultaten
+    lst_rows = []
+    dict_postings = {}
+    dict_prefixes = {}
+    for id_document, document in enumerate(lst_documents):
+        lst_words = []
+        for text in document["text"]:
+            lst_words.extend(words(text))
+        lst_achternaam = words(document.get("achternaam"))
+        if len(lst_achternaam) > 1:
+            lst_words.append("".join(lst_achternaam))
+        for word in set(lst_words):
+            dict_postings.setdefault(word, []).append(id_document)
+        for prefix in {
+            word[:length]
+            for word in lst_words
+            for length in range(1, min(len(word), PREFIX_LENGTH) + 1)
+        }:
+            dict_prefixes.setdefault(prefix, []).append(id_document)
+        lst_rows.append(
+            (
+                id_document,
+                document["type"],
+                document["label"],
+                document["detail"],
+                document["url"],
+            )
+        )
+    connection.executemany("INSERT INTO zoek_document VALUES (?, ?, ?, ?, ?)", lst_rows)
+    connection.executemany(
+        "INSERT INTO zoek_woord VALUES (?, ?)",
+        ((word, pack(lst_ids)) for word, lst_ids in dict_postings.items()),
+    )
+    connection.executemany(
+        "INSERT INTO zoek_begin VALUES (?, ?)",
+        ((prefix, pack(lst_ids)) for prefix, lst_ids in dict_prefixes.items()),
+    )
+
+
+class SearchIndex:
+    def __init__(self, connect) -> None:
+        """Zoekt in de index die write_index heeft geschreven; connect geeft een
+        verbinding met die database"""
+        self.connect = connect
+
+    def __execute(self, sql_statement: str, params) -> list:
+        cursor = self.connect().cursor()
+        cursor.row_factory = None
+        return cursor.execute(sql_statement, params).fetchall()
+
+    def __postings(self, sql_statement: str, params) -> set:
+        rows = self.__execute(sql_statement, params)
+        return set(unpack(b"".join(row[0] for row in rows)))
+
+    def __prefix(self, word: str) -> set:
+        if len(word) <= PREFIX_LENGTH:
+            return self.__postings(
+                "SELECT documenten FROM zoek_begin WHERE begin = ?", (word,)
+            )
+        # Woorden die met word beginnen liggen aaneengesloten in de primaire sleutel
+        return self.__postings(
+            "SELECT documenten FROM zoek_woord WHERE woord >= ? AND woord < ?",
+            (word, word + "\uffff"),
+        )
+
+    def __exact(self, word: str) -> set:
+        return self.__postings(
+            "SELECT documenten FROM zoek_woord WHERE woord = ?", (word,)
+        )
+
+    def __documents(self, lst_ids: list) -> list:
+        placeholders = ", ".join("?" * len(lst_ids))
+        rows = self.__execute(
+            f"""SELECT id_document, type, label, detail, url
+            FROM zoek_document
+            WHERE id_document IN ({placeholders})""",
+            lst_ids,
+        )
+        dict_documents = {
+            row[0]: {"type": row[1], "label": row[2], "detail": row[3], "url": row[4]}
+            for row in rows
+        }
+        return [dict_documents[id_document] for id_document in lst_ids]
+
+    def search(self, query: str, limit: int = 20) -> list:
+        """Documenten met alle woorden van de zoekvraag, beste eerst"""
+        lst_words = query_words(query)
+        if len(lst_words) == 0:
+            return []
+        candidates = None
+        for word in sorted(lst_words, key=len, reverse=True):
+            documents = self.__prefix(word)
+            candidates = documents if candidates is None else candidates & documents
+            if len(candidates) == 0:
+                return []
+
+        # Hele woorden gaan voor woorden die alleen met de zoekvraag beginnen
+        dict_exact = {}
+        for word in lst_words:
+            for id_document in self.__exact(word) & candidates:
+                dict_exact[id_document] = dict_exact.get(id_document, 0) + 1
+        lst_ids = sorted(dict_exact, key=lambda id: (-dict_exact[id], id))[:limit]
+        if len(lst_ids) < limit:
+            lst_ids.extend(
+                heapq.nsmallest(limit - len(lst_ids), candidates.difference(dict_exact))
+            )
+        return self.__documents(lst_ids)
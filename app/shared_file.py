@@ -0,0 +1,94 @@
+"""Gedeeld, alleen-lezen SQLite bestand per data generatie
+
+Gegevens die anders elk proces zelf in het geheugen opbouwt (media register,
+manifest en zoekindex) schrijft één proces per data generatie in een SQLite
+bestand in een gedeelde directory. Alle workers lezen dat bestand via mmap, zodat
+het maar één keer in het geheugen staat (in de page cache van het OS), en zoeken
+per request alleen op wat ze nodig hebben.
+
+Het schrijven gebeurt onder een file lock in een tijdelijk bestand dat daarna in
+een keer op zijn plaats wordt gezet; andere processen wachten op de lock en
+openen dan het geschreven bestand. Van de vorige bestanden blijft er een staan
+voor workers die de nieuwe data generatie nog niet hebben gezien.
+"""
+
+import fcntl
+import glob
+import os
+import sqlite3
+import threading
+
+# Maximale grootte waarmee het bestand in het geheugen wordt gemapt
+MMAP_SIZE = 1 << 30
+
+PREFIX = "kna_gedeeld_"
+
+# Aantal bewaarde bestanden, inclusief het huidige
+FILES_KEEP = 2
+
+
+class SharedFile:
+    def __init__(self, path: str) -> None:
+        """Leest het gedeelde bestand met een eigen verbinding per thread"""
+        self.path = path
+        self.__local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self.__local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                f"file:{self.path}?mode=ro", uri=True, check_same_thread=False
+            )
+            connection.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+            connection.row_factory = sqlite3.Row
+            self.__local.connection = connection
+        return connection
+
+    def fetch_one(self, sql_statement: str, params: tuple = ()) -> sqlite3.Row:
+        """Eerste rij, None wanneer er geen rij is"""
+        return self.connection().execute(sql_statement, params).fetchone()
+
+    def fetch_all(self, sql_statement: str, params: tuple = ()) -> list:
+        return self.connection().execute(sql_statement, params).fetchall()
+
+
+def open_shared(dir_shared: str, key: str, build) -> SharedFile:
+    """Het gedeelde bestand voor key; bestaat het nog niet, dan wordt het eerst
+    geschreven met build(connection)"""
+    os.makedirs(dir_shared, exist_ok=True)
+    path = os.path.join(dir_shared, f"{PREFIX}{key}.sqlite")
+    if os.path.exists(path):
+        return SharedFile(path)
+    with open(os.path.join(dir_shared, PREFIX + "lock"), "w") as file_lock:
+        fcntl.flock(file_lock, fcntl.LOCK_EX)
+        if not os.path.exists(path):
+            path_tmp = f"{path}.{os.getpid()}.tmp"
+            if os.path.exists(path_tmp):
+                os.remove(path_tmp)
+            connection = sqlite3.connect(path_tmp)
+            try:
+                build(connection)
+                connection.commit()
+            finally:
+                connection.close()
+            os.chmod(path_tmp, 0o444)
+            os.replace(path_tmp, path)
+            remove_old(dir_shared)
+    return SharedFile(path)
+
+
+def remove_old(dir_shared: str) -> None:
+    """Verwijdert alle bestanden behalve de FILES_KEEP nieuwste
+
+    Workers die een verwijderd bestand nog open hebben, blijven het lezen.
+    """
+    lst_files = sorted(
+        glob.glob(os.path.join(dir_shared, PREFIX + "*.sqlite")),
+        key=os.path.getmtime,
+        reverse=True,
+    )
+    for path in lst_files[FILES_KEEP:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,58 @@
+// Volgende pagina's van een overzicht laden zodra het einde in beeld komt. Zonder
+// JavaScript blijft de knop 'Meer laden' een gewone link naar de volgende pagina.
+document.querySelectorAll(".lazy-load").forEach(function (loader) {
+  if (loader.dataset.started) {
+    return;
+  }
+  loader.dataset.started = "1";
+  var target = document.getElementById(loader.dataset.target);
+  var margin = 600;
+  var loading = false;
+
+  function nearBottom() {
+    return loader.getBoundingClientRect().top < window.innerHeight + margin;
+  }
+
+  function load() {
+    if (loading || !loader.dataset.next) {
+      return;
+    }
+    loading = true;
+    var url = loader.dataset.api + "?html=1&cursor=" + encodeURIComponent(loader.dataset.next);
+    fetch(url)
+      .then(function (response) {
+        return response.json();
+      })
+      .then(function (page) {
+        target.insertAdjacentHTML("beforeend", page.html);
+        loading = false;
+        if (!page.next) {
+          observer.disconnect();
+          loader.remove();
+          return;
+        }
+        loader.dataset.next = page.next;
+        loader.querySelector("a").href = "?cursor=" + encodeURIComponent(page.next);
+        if (nearBottom()) {
+          load();
+        }
+      })
+      .catch(function () {
+        loading = false;
+      });
+  }
+
+  var observer = new IntersectionObserver(
+    function (entries) {
+      if (entries[0].isIntersecting) {
+        load();
+      }
+    },
+    { rootMargin: margin + "px" }
+  );
+  observer.observe(loader);
+  loader.querySelector("a").addEventListener("click", function (event) {
+    event.preventDefault();
+    load();
+  });
+});
@@ -0,0 +1,69 @@
+// Suggesties onder het zoekveld in de navigatiebalk, via /api/zoek. Zonder
+// JavaScript gaat het formulier gewoon naar de pagina /zoek.
+(function () {
+  var input = document.getElementById("zoek");
+  var menu = document.getElementById("zoek-suggesties");
+  if (!input || !menu) {
+    return;
+  }
+  var timer = null;
+  var latest = "";
+
+  function hide() {
+    menu.classList.remove("show");
+    menu.innerHTML = "";
+  }
+
+  function show(items) {
+    menu.innerHTML = "";
+    items.forEach(function (item) {
+      var link = document.createElement("a");
+      link.className = "dropdown-item";
+      link.href = item.url;
+      var label = document.createElement("b");
+      label.textContent = item.label;
+      var detail = document.createElement("small");
+      detail.className = "text-muted ml-2";
+      detail.textContent = item.detail;
+      link.appendChild(label);
+      link.appendChild(detail);
+      menu.appendChild(link);
+    });
+    menu.classList.toggle("show", items.length > 0);
+  }
+
+  function suggest() {
+    var query = input.value.trim();
+    latest = query;
+    if (query.length < 2) {
+      hide();
+      return;
+    }
+    fetch("/api/zoek?q=" + encodeURIComponent(query))
+      .then(function (response) {
+        return response.json();
+      })
+      .then(function (result) {
+        // Antwoorden op eerdere toetsaanslagen negeren
+        if (result.query === latest) {
+          show(result.items);
+        }
+      })
+      .catch(hide);
+  }
+
+  input.addEventListener("input", function () {
+    clearTimeout(timer);
+    timer = setTimeout(suggest, 150);
+  });
+  input.addEventListener("keydown", function (event) {
+    if (event.key === "Escape") {
+      hide();
+    }
+  });
+  document.addEventListener("click", function (event) {
+    if (!menu.contains(event.target) && event.target !== input) {
+      hide();
+    }
+  });
+})();
@@ -0,0 +1,187 @@
+"""Concurrency test van de web-app onder gunicorn, met een oplopend aantal workers
+
+Per aantal workers wordt gunicorn gestart met app/gunicorn.conf.py op een
+synthetisch archief (zie synthetic.py, met KNA_BACKEND=sqlite), waarna een aantal
+clients gedurende een vaste tijd tegelijk pagina's opvraagt. Per aantal workers
+worden de doorvoer (requests/s), de mediaan en het 95e percentiel van de duur en
+het aantal fouten vastgelegd in een JSON bestand. De page cache staat standaard
+uit, zodat het renderen van de pagina's wordt gemeten.
+
+De doorvoer kan alleen meegroeien met het aantal workers zolang er cores vrij
+zijn; de clients draaien op dezelfde machine en gebruiken ook CPU.
+
+Gebruik: python bench_concurrency.py [--workers 1,2,4] [--clients 16] [--duration 10]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import pandas as pd
+
+import synthetic
+
+DIR_APP = os.path.join(synthetic.DIR_REPO, "app")
+
+
+def sample_urls(tables: dict, qty: int = 10) -> list:
+    """Overzichten en een aantal detailpagina's van leden en voorstellingen"""
+    df_lid = tables["lid"]
+    df_lid = df_lid.loc[(df_lid["gdpr_permission"] == 1) & df_lid["Achternaam"].notna()]
+    lst_urls = ["/leden", "/voorstellingen", "/tijdslijn", "/zoek?q=van"]
+    lst_urls += [f"/lid_media/{quote(id_lid)}" for id_lid in df_lid["id_lid"][:qty]]
+    lst_urls += [
+        f"/voorstelling_media/{quote(voorstelling)}"
+        for voorstelling in tables["uitvoering"]["ref_uitvoering"][:qty]
+    ]
+    return lst_urls
+
+
+def start_server(workers: int, args, file_sqlite: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        KNA_BACKEND="sqlite",
+        KNA_SQLITE=file_sqlite,
+        KNA_BIND=f"127.0.0.1:{args.port}",
+        KNA_WORKERS=str(workers),
+        KNA_THREADS=str(args.threads),
+        KNA_WORKER_CLASS=args.worker_class,
+        KNA_PAGE_CACHE_MB=str(args.page_cache_mb),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "wsgi:app"],
+        cwd=DIR_APP,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    # Wachten tot alle workers antwoorden
+    time_limit = time.monotonic() + 120
+    while time.monotonic() < time_limit:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{args.port}/", timeout=1).read()
+            return server
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"Gunicorn met {workers} workers start niet")
+
+
+def client(base_url: str, lst_urls: list, time_end: float, offset: int) -> tuple:
+    """Vraagt pagina's op tot time_end; geeft de duur per request en de fouten"""
+    lst_durations = []
+    qty_errors = 0
+    i = offset
+    while time.monotonic() < time_end:
+        url = base_url + lst_urls[i % len(lst_urls)]
+        i = i + 1
+        time_start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                response.read()
+            lst_durations.append(time.perf_counter() - time_start)
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            qty_errors = qty_errors + 1
+    return lst_durations, qty_errors
+
+
+def measure(workers: int, args, file_sqlite: str, lst_urls: list) -> dict:
+    server = start_server(workers=workers, args=args, file_sqlite=file_sqlite)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        # Opwarmen: elke pagina een keer
+        client(base_url, lst_urls, time.monotonic() + 1, offset=0)
+        time_end = time.monotonic() + args.duration
+        with ThreadPoolExecutor(max_workers=args.clients) as executor:
+            futures = [
+                executor.submit(client, base_url, lst_urls, time_end, offset)
+                for offset in range(args.clients)
+            ]
+            results = [future.result() for future in futures]
+    finally:
+        server.terminate()
+        server.wait()
+    lst_durations = sorted(
+        duration for durations, _ in results for duration in durations
+    )
+    qty_errors = sum(errors for _, errors in results)
+    if len(lst_durations) == 0:
+        return {"requests": 0, "errors": qty_errors}
+    return {
+        "requests": len(lst_durations),
+        "errors": qty_errors,
+        "requests_per_s": len(lst_durations) / args.duration,
+        "median_ms": statistics.median(lst_durations) * 1000,
+        "p95_ms": lst_durations[int(0.95 * (len(lst_durations) - 1))] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Concurrency test van de web-app")
+    parser.add_argument("--workers", default="1,2,4", help="Aantallen workers")
+    parser.add_argument("--threads", type=int, default=4, help="Threads per worker")
+    parser.add_argument("--worker-class", default="gthread")
+    parser.add_argument("--clients", type=int, default=16, help="Gelijktijdige clients")
+    parser.add_argument("--duration", type=float, default=10, help="Seconden per run")
+    parser.add_argument("--scale", type=int, default=1, help="Archief schaal")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument(
+        "--page-cache-mb", type=float, default=0, help="Page cache (standaard uit)"
+    )
+    parser.add_argument(
+        "--dir",
+        default=os.path.join(tempfile.gettempdir(), "kna_benchmark"),
+        help="Map voor de synthetische databases",
+    )
+    parser.add_argument("--output", default="concurrency_results.json")
+    args = parser.parse_args()
+
+    os.makedirs(args.dir, exist_ok=True)
+    tables = synthetic.generate(scale=args.scale, seed=args.seed)
+    file_sqlite = os.path.join(
+        args.dir, f"kna_benchmark_{args.scale}_{args.seed}.sqlite"
+    )
+    if not os.path.exists(file_sqlite):
+        print(f"Schaal {args.scale}: database maken in {file_sqlite}")
+        synthetic.write_sqlite(tables=tables, file_sqlite=file_sqlite)
+    lst_urls = sample_urls(tables)
+
+    results = {
+        "created": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "cores": len(os.sched_getaffinity(0)),
+        "threads": args.threads,
+        "worker_class": args.worker_class,
+        "clients": args.clients,
+        "duration": args.duration,
+        "scale": args.scale,
+        "workers": {},
+    }
+    for workers in [int(workers) for workers in args.workers.split(",")]:
+        result = measure(
+            workers=workers, args=args, file_sqlite=file_sqlite, lst_urls=lst_urls
+        )
+        results["workers"][str(workers)] = result
+        print(
+            f"{workers:>3} workers: {result.get('requests_per_s', 0):>8.1f} req/s,"
+            f" mediaan {result.get('median_ms', 0):>8.1f} ms,"
+            f" p95 {result.get('p95_ms', 0):>8.1f} ms, {result['errors']} fouten"
+        )
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Resultaten opgeslagen in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Benchmark van de KnaDB leesmethoden op synthetische archieven
+
+Per schaal wordt een SQLite database gemaakt met synthetic.py (en bewaard in
+--dir, zodat een volgende run die hergebruikt), waarna elke leesmethode een
+aantal keer wordt uitgevoerd. Per methode worden de mediaan, het minimum en het
+95e percentiel van de duur en het geheugengebruik (piek, via tracemalloc) van
+een enkele aanroep vastgelegd in een JSON bestand. Met --baseline worden de
+resultaten vergeleken met een eerdere run.
+
+Gebruik: python bench_reader.py [--scales 1,10,100] [--output resultaten.json]
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+import synthetic
+
+sys.path.append(os.path.join(synthetic.DIR_REPO, "app"))
+from data_reader import KnaDB  # noqa: E402
+from logging_kna import logger  # noqa: E402
+
+
+def sample_keys(tables: dict) -> dict:
+    """Het lid en de voorstelling met de meeste media, en een afbeelding"""
+    df_files_leden = tables["file_leden"]
+    df_lid = tables["lid"]
+    df_lid = df_lid.loc[(df_lid["gdpr_permission"] == 1) & df_lid["Achternaam"].notna()]
+    df_files_leden = df_files_leden.loc[df_files_leden["lid"].isin(df_lid["id_lid"])]
+    id_lid = df_files_leden["lid"].value_counts().index[0]
+    voorstelling = df_files_leden.loc[
+        df_files_leden["lid"] == id_lid, "ref_uitvoering"
+    ].value_counts().index[0]
+    df_files = tables["file"]
+    id_file = df_files.loc[df_files["file_ext"] == "jpg", "id_file"].iloc[0]
+    return {"id_lid": id_lid, "voorstelling": voorstelling, "id_file": id_file}
+
+
+def reader_calls(db_reader: KnaDB, keys: dict) -> dict:
+    """Alle leesmethoden van KnaDB, met argumenten"""
+    id_lid, voorstelling = keys["id_lid"], keys["voorstelling"]
+    return {
+        "refresh": lambda: db_reader.refresh(force=True),
+        "leden": db_reader.leden,
+        "voorstellingen": db_reader.voorstellingen,
+        "timeline": db_reader.timeline,
+        "leden_page": db_reader.leden_page,
+        "voorstellingen_page": db_reader.voorstellingen_page,
+        "timeline_page": db_reader.timeline_page,
+        "lid_info": lambda: db_reader.lid_info(id_lid=id_lid),
+        "lid_rollen": lambda: db_reader.lid_rollen(id_lid=id_lid),
+        "lid_media": lambda: db_reader.lid_media(id_lid=id_lid),
+        "voorstelling_info": lambda: db_reader.voorstelling_info(
+            voorstelling=voorstelling
+        ),
+        "voorstelling_rollen": lambda: db_reader.voorstelling_rollen(
+            voorstelling=voorstelling
+        ),
+        "voorstelling_media": lambda: db_reader.voorstelling_media(
+            voorstelling=voorstelling
+        ),
+        "voorstelling_thumbnail": lambda: db_reader.voorstelling_thumbnail(
+            voorstelling=voorstelling
+        ),
+        "voorstelling_lid_media": lambda: db_reader.voorstelling_lid_media(
+            voorstelling=voorstelling, lid=id_lid
+        ),
+        "medium": lambda: db_reader.medium(id_media=keys["id_file"]),
+        "media_path": lambda: db_reader.media_path(id_media=keys["id_file"]),
+    }
+
+
+def measure(call, repeat: int) -> dict:
+    durations = []
+    for _ in range(repeat):
+        time_start = time.perf_counter()
+        call()
+        durations.append(time.perf_counter() - time_start)
+    # Geheugen apart meten, tracemalloc vertraagt de aanroep
+    tracemalloc.start()
+    call()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    durations_ms = sorted(duration * 1000 for duration in durations)
+    return {
+        "median_ms": round(statistics.median(durations_ms), 3),
+        "min_ms": round(durations_ms[0], 3),
+        "p95_ms": round(durations_ms[int(0.95 * (len(durations_ms) - 1))], 3),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def bench_scale(scale: int, dir_data: str, repeat: int, seed: int) -> dict:
+    tables = synthetic.generate(scale=scale, seed=seed)
+    file_sqlite = os.path.join(dir_data, f"kna_benchmark_{scale}_{seed}.sqlite")
+    if not os.path.exists(file_sqlite):
+        print(f"Schaal {scale}: database maken in {file_sqlite}")
+        synthetic.write_sqlite(tables=tables, file_sqlite=file_sqlite)
+    db_reader = KnaDB(dir_resources=dir_data, backend="sqlite", file_sqlite=file_sqlite)
+    keys = sample_keys(tables)
+
+    dict_methods = {}
+    for name, call in reader_calls(db_reader, keys).items():
+        dict_methods[name] = measure(call, repeat=repeat)
+        print(f"Schaal {scale:>4} {name:<24} {dict_methods[name]['median_ms']:>10.2f} ms")
+    return {
+        "rows": {name: df.shape[0] for name, df in tables.items()},
+        "keys": keys,
+        "methods": dict_methods,
+    }
+
+
+def compare(results: dict, file_baseline: str) -> None:
+    """Verhouding van de mediaan ten opzichte van de baseline (<1 is sneller)"""
+    with open(file_baseline) as file:
+        baseline = json.load(file)
+    for scale, dict_scale in results["scales"].items():
+        if scale not in baseline["scales"]:
+            continue
+        methods_baseline = baseline["scales"][scale]["methods"]
+        for name, dict_method in dict_scale["methods"].items():
+            if name not in methods_baseline:
+                continue
+            median_old = methods_baseline[name]["median_ms"]
+            ratio = dict_method["median_ms"] / median_old if median_old > 0 else 0
+            print(
+                f"Schaal {scale:>4} {name:<24} {median_old:>10.2f} ms ->"
+                f" {dict_method['median_ms']:>10.2f} ms ({ratio:.2f}x)"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark van de KnaDB methoden")
+    parser.add_argument("--scales", default="1,10,100", help="Archief schalen")
+    parser.add_argument("--repeat", type=int, default=10, help="Aanroepen per methode")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--dir",
+        default=os.path.join(tempfile.gettempdir(), "kna_benchmark"),
+        help="Map voor de synthetische databases",
+    )
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Eerdere resultaten om mee te vergelijken")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    os.makedirs(args.dir, exist_ok=True)
+    results = {
+        "created": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "repeat": args.repeat,
+        "scales": {},
+    }
+    for scale in [int(scale) for scale in args.scales.split(",")]:
+        results["scales"][str(scale)] = bench_scale(
+            scale=scale, dir_data=args.dir, repeat=args.repeat, seed=args.seed
+        )
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Resultaten opgeslagen in {args.output}")
+    if args.baseline is not None:
+        compare(results=results, file_baseline=args.baseline)
+
+
+if __name__ == "__main__":
+    main()
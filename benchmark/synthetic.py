@@ -0,0 +1,190 @@
+"""Synthetisch archief voor benchmarks, in dezelfde tabellen als de loader maakt
+
+Schaal 1 is ongeveer de omvang van het archief nu; hogere schalen vermenigvuldigen
+het aantal leden en voorstellingen, het aantal rollen en bestanden per
+voorstelling blijft gelijk. De data is bij hetzelfde seed altijd gelijk.
+"""
+
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+DIR_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(DIR_REPO, "data_loader"))
+import schema  # noqa: E402
+
+QTY_LEDEN = 400
+QTY_VOORSTELLINGEN = 120
+QTY_ROLLEN = 10
+QTY_BESTANDEN = 25
+QTY_LEDEN_BESTAND = 4
+TUSSENVOEGSELS = ["", "", "", "van ", "de ", "van der ", "van den "]
+FILE_EXTENSIONS = ["jpg", "jpg", "jpg", "jpg", "jpg", "jpg", "png", "pdf", "pdf", "mp4"]
+MEDIA_TYPES = ["foto", "poster", "kaartje", "krant", "programmaboekje", "video"]
+
+
+def leden(rng: np.random.Generator, qty: int) -> pd.DataFrame:
+    nummers = np.arange(qty).astype(str)
+    tussenvoegsel = rng.choice(TUSSENVOEGSELS, size=qty)
+    voornaam = "Voornaam" + pd.Series(nummers)
+    achternaam = tussenvoegsel + "Achternaam" + pd.Series(nummers)
+    achternaam_sort = np.where(
+        tussenvoegsel == "",
+        achternaam,
+        "Achternaam" + pd.Series(nummers) + ", " + pd.Series(tussenvoegsel).str.strip(),
+    )
+    zonder_achternaam = rng.random(qty) < 0.02
+    df_lid = pd.DataFrame(
+        {
+            "id_lid": voornaam + " " + achternaam,
+            "Voornaam": voornaam,
+            "Achternaam": achternaam.where(~zonder_achternaam, None),
+            "Geboortedatum": pd.Timestamp("1920-01-01")
+            + pd.to_timedelta(rng.integers(0, 30000, size=qty), unit="D"),
+            "Startjaar": rng.integers(1930, 2024, size=qty).astype(float),
+            "gdpr_permission": (rng.random(qty) < 0.9).astype(int),
+            "achternaam_sort": np.where(zonder_achternaam, "zzzzzzzz", achternaam_sort),
+        }
+    )
+    return df_lid
+
+
+def voorstellingen(rng: np.random.Generator, qty: int) -> pd.DataFrame:
+    jaar = 1930 + np.arange(qty) * 94 // qty
+    titel = "Titel " + pd.Series(np.arange(qty).astype(str))
+    datum_van = pd.to_datetime(jaar.astype(str) + "-03-01") + pd.to_timedelta(
+        rng.integers(0, 270, size=qty), unit="D"
+    )
+    df_uitvoering = pd.DataFrame(
+        {
+            "ref_uitvoering": jaar.astype(str) + " " + titel,
+            "titel": titel,
+            "jaar": jaar,
+            "datum_van": datum_van,
+            "datum_tot": datum_van + pd.Timedelta(days=7),
+            "folder": jaar.astype(str) + "/" + titel,
+            "type": np.where(rng.random(qty) < 0.8, "Uitvoering", "Evenement"),
+            "locatie": "Zaal",
+            "auteur": "Auteur " + pd.Series((np.arange(qty) % 40).astype(str)),
+            "Notitie": None,
+        }
+    )
+    return df_uitvoering
+
+
+def rollen(rng: np.random.Generator, df_lid, df_uitvoering) -> pd.DataFrame:
+    qty = df_uitvoering.shape[0]
+    cast = rng.integers(0, df_lid.shape[0], size=(qty, QTY_ROLLEN))
+    df_rol = pd.DataFrame(
+        {
+            "ref_uitvoering": np.repeat(
+                df_uitvoering["ref_uitvoering"].values, QTY_ROLLEN
+            ),
+            "id_lid": df_lid["id_lid"].values[cast.ravel()],
+            "rol": "Rol " + pd.Series(np.tile(np.arange(QTY_ROLLEN), qty).astype(str)),
+            "rol_bijnaam": np.where(
+                rng.random(qty * QTY_ROLLEN) < 0.2, "bijnaam", None
+            ),
+        }
+    )
+    # Eerste lid van de cast doet ook de regie
+    df_regie = df_rol.groupby("ref_uitvoering", sort=False).head(1).copy()
+    df_regie["rol"] = "Regie"
+    df_regie["rol_bijnaam"] = None
+    return pd.concat([df_rol, df_regie], ignore_index=True)
+
+
+def bestanden(rng: np.random.Generator, df_uitvoering) -> pd.DataFrame:
+    qty_per_voorstelling = rng.poisson(QTY_BESTANDEN, size=df_uitvoering.shape[0])
+    df_files = df_uitvoering.loc[
+        df_uitvoering.index.repeat(qty_per_voorstelling), ["ref_uitvoering", "folder"]
+    ].reset_index(drop=True)
+    volgnummer = df_files.groupby("ref_uitvoering").cumcount()
+    file_ext = rng.choice(FILE_EXTENSIONS, size=df_files.shape[0])
+    df_files["bestand"] = "IMG_" + volgnummer.map("{:04d}".format) + "." + file_ext
+    df_files["type_media"] = np.where(
+        volgnummer == 0, "poster", rng.choice(MEDIA_TYPES, size=df_files.shape[0])
+    )
+    df_files["Niet_compleet"] = 0
+    df_files["bijschrift"] = None
+    df_files["file_ext"] = file_ext
+    df_files["id_file"] = [
+        hashlib.sha1(f"{folder}/{bestand}".encode("utf-8")).hexdigest()[:12]
+        for folder, bestand in zip(df_files["folder"], df_files["bestand"])
+    ]
+    return df_files
+
+
+def bestanden_leden(rng: np.random.Generator, df_files, df_rol) -> pd.DataFrame:
+    # Leden op een bestand komen uit de cast van de voorstelling
+    df_cast = df_rol.loc[df_rol["rol"] != "Regie", ["ref_uitvoering", "id_lid"]]
+    df_cast = df_cast.assign(positie=df_cast.groupby("ref_uitvoering").cumcount())
+    qty_leden = rng.integers(0, QTY_LEDEN_BESTAND + 1, size=df_files.shape[0])
+    df_files_leden = df_files.loc[df_files.index.repeat(qty_leden)]
+    df_files_leden = df_files_leden.reset_index(drop=True)
+    qty_files_leden = df_files_leden.shape[0]
+    df_files_leden["positie"] = rng.integers(0, QTY_ROLLEN, size=qty_files_leden)
+    df_files_leden = df_files_leden.merge(
+        df_cast, how="inner", on=["ref_uitvoering", "positie"]
+    ).rename(columns={"id_lid": "lid"})
+    df_files_leden = df_files_leden.drop_duplicates(
+        subset=["ref_uitvoering", "bestand", "lid"]
+    )
+    df_files_leden["vlnr"] = "lid_" + df_files_leden.groupby(
+        ["ref_uitvoering", "bestand"]
+    ).cumcount().astype(str)
+    columns = ["ref_uitvoering", "bestand", "id_file", "type_media", "file_ext"]
+    columns = columns + ["folder", "vlnr", "lid"]
+    return df_files_leden[columns].reset_index(drop=True)
+
+
+def generate(scale: int = 1, seed: int = 0) -> dict:
+    """Alle archief tabellen, met de afgeleide kolommen die de loader toevoegt"""
+    rng = np.random.default_rng(seed)
+    df_lid = leden(rng, QTY_LEDEN * scale)
+    df_uitvoering = voorstellingen(rng, QTY_VOORSTELLINGEN * scale)
+    df_rol = rollen(rng, df_lid, df_uitvoering)
+    df_files = bestanden(rng, df_uitvoering)
+    df_files_leden = bestanden_leden(rng, df_files, df_rol)
+
+    df_regie = df_rol.loc[df_rol["rol"] == "Regie", ["ref_uitvoering", "id_lid"]]
+    df_regie.columns = ["ref_uitvoering", "regie"]
+    df_uitvoering = df_uitvoering.merge(df_regie, how="left", on="ref_uitvoering")
+    sr_qty = df_files.groupby("ref_uitvoering").size().rename("qty_media")
+    df_uitvoering = df_uitvoering.merge(sr_qty, how="left", on="ref_uitvoering")
+    df_uitvoering["qty_media"] = df_uitvoering["qty_media"].fillna(0)
+    df_rol_files = df_files_leden.groupby(["ref_uitvoering", "lid"]).size()
+    df_rol_files = df_rol_files.reset_index()
+    df_rol_files.columns = ["ref_uitvoering", "id_lid", "qty_media"]
+    df_rol = df_rol.merge(df_rol_files, how="left", on=["ref_uitvoering", "id_lid"])
+    df_rol["qty_media"] = df_rol["qty_media"].fillna(0)
+
+    return {
+        "lid": df_lid,
+        "media_type": pd.DataFrame({"type_media": MEDIA_TYPES}),
+        "file_leden": df_files_leden,
+        "file": df_files,
+        "uitvoering": df_uitvoering,
+        "rol": df_rol,
+        "laad_generatie": pd.DataFrame(
+            {
+                "generatie": [f"synthetisch-{scale}-{seed}"],
+                "geladen_op": [pd.Timestamp.now()],
+            }
+        ),
+    }
+
+
+def write_sqlite(tables: dict, file_sqlite: str) -> None:
+    """Schrijft de tabellen volgens het schema van de loader naar een SQLite bestand"""
+    if os.path.exists(file_sqlite):
+        os.remove(file_sqlite)
+    engine = create_engine("sqlite:///" + file_sqlite)
+    with engine.begin() as connection:
+        for name, df in tables.items():
+            schema.write_table(connection, df, name)
+    engine.dispose()
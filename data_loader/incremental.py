@@ -0,0 +1,158 @@
+"""Incrementeel laden van tabellen: alleen gewijzigde rijen worden geschreven
+
+Voor elke tabel wordt in laad_hash per natuurlijke sleutel een hash van de
+bijbehorende rijen bijgehouden, plus een hash over de hele tabel (sleutel "*").
+Bij een volgende import worden alleen sleutels die nieuw, gewijzigd of
+verdwenen zijn verwijderd en/of opnieuw ingevoegd. Afgeleide kolommen zoals
+qty_media en regie worden in pandas over de volledige data berekend, dus een
+wijziging daarin maakt de rij vanzelf 'gewijzigd'. Wijzigingen worden geschreven
+in de staging tabellen van de publicatie (zie publish.py); de hashes en kolommen
+van de vorige import worden uit de live tabellen gelezen.
+"""
+
+import hashlib
+import json
+
+import pandas as pd
+from sqlalchemy import Engine, inspect, text
+
+import schema
+from publish import Publication
+
+TABLE_HASH = "laad_hash"
+KEY_TABLE = "*"
+
+
+def row_keys(df: pd.DataFrame, keys: list) -> pd.Series:
+    """Natuurlijke sleutel per rij als JSON tekst"""
+    df_keys = df[keys].astype(object)
+    df_keys = df_keys.where(df_keys.notna(), None)
+    return pd.Series(
+        [json.dumps(list(key), default=str) for key in df_keys.itertuples(index=False)],
+        index=df.index,
+    )
+
+
+def key_hashes(df: pd.DataFrame, sleutels: pd.Series) -> pd.Series:
+    """Hash van alle rijen per natuurlijke sleutel"""
+    row_hashes = pd.util.hash_pandas_object(df, index=False).map("{:016x}".format)
+    df_rows = pd.DataFrame({"sleutel": sleutels, "hash": row_hashes})
+    sr_hashes = df_rows.groupby("sleutel", sort=False)["hash"].agg("".join)
+    return sr_hashes.map(lambda x: hashlib.sha1(x.encode("utf-8")).hexdigest())
+
+
+def table_hash(df: pd.DataFrame, sr_hashes: pd.Series) -> str:
+    content = json.dumps(list(df.columns)) + "".join(sorted(sr_hashes))
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def read_hashes(engine: Engine, name: str) -> pd.Series:
+    if not inspect(engine).has_table(TABLE_HASH):
+        return pd.Series(dtype=object)
+    df_hashes = pd.read_sql(
+        sql=text(f"SELECT sleutel, hash FROM {TABLE_HASH} WHERE tabel = :tabel"),
+        con=engine,
+        params={"tabel": name},
+    )
+    return df_hashes.set_index("sleutel")["hash"]
+
+
+def write_hashes(connection, name: str, sr_hashes: pd.Series, target: str) -> None:
+    df_hashes = pd.DataFrame(
+        {"tabel": name, "sleutel": sr_hashes.index, "hash": sr_hashes.values}
+    )
+    if not inspect(connection).has_table(target):
+        schema.create_table(connection, df_hashes, TABLE_HASH, target=target)
+    schema.insert_rows(connection, df_hashes, target)
+
+
+def delete_hashes(connection, name: str, sleutels: list, target: str) -> None:
+    if len(sleutels) == 0:
+        return
+    connection.execute(
+        text(f"DELETE FROM {target} WHERE tabel = :tabel AND sleutel = :sleutel"),
+        [{"tabel": name, "sleutel": sleutel} for sleutel in sleutels],
+    )
+
+
+def delete_keys(connection, name: str, keys: list, sleutels: list) -> None:
+    if len(sleutels) == 0:
+        return
+    # NULL-veilige vergelijking, zodat ook lege sleutelwaarden matchen
+    equals = "<=>" if connection.dialect.name == "mysql" else "IS"
+    conditions = " AND ".join(f"{key} {equals} :k{i}" for i, key in enumerate(keys))
+    params = [
+        {f"k{i}": value for i, value in enumerate(json.loads(sleutel))}
+        for sleutel in sleutels
+    ]
+    connection.execute(text(f"DELETE FROM {name} WHERE {conditions}"), params)
+
+
+def write_table(
+    publication: Publication,
+    df: pd.DataFrame,
+    name: str,
+    keys: list,
+    incremental: bool,
+) -> None:
+    """Schrijft een tabel, incrementeel wanneer mogelijk en gevraagd"""
+    engine = publication.engine
+    sleutels = row_keys(df, keys)
+    sr_hashes = key_hashes(df, sleutels)
+    sr_hashes[KEY_TABLE] = table_hash(df, sr_hashes)
+
+    sr_hashes_old = pd.Series(dtype=object)
+    columns_old = []
+    if incremental and inspect(engine).has_table(name):
+        sr_hashes_old = read_hashes(engine, name)
+        columns_old = [column["name"] for column in inspect(engine).get_columns(name)]
+    if (
+        columns_old != list(df.columns)
+        or KEY_TABLE not in sr_hashes_old
+        or not schema.has_indexes(engine, df, name)
+    ):
+        # Volledig laden: eerste keer, gewijzigde kolommen of schema, of niet
+        # incrementeel
+        with engine.begin() as connection:
+            target = publication.stage(connection, name)
+            schema.write_table(connection, df, name, target=target)
+            target_hash = publication.stage(connection, TABLE_HASH, copy=True)
+            if inspect(connection).has_table(target_hash):
+                connection.execute(
+                    text(f"DELETE FROM {target_hash} WHERE tabel = :tabel"),
+                    {"tabel": name},
+                )
+            write_hashes(connection, name, sr_hashes, target=target_hash)
+        print(f"{name}: {df.shape[0]} rijen volledig geladen")
+        return
+    if sr_hashes_old[KEY_TABLE] == sr_hashes[KEY_TABLE]:
+        print(f"{name}: ongewijzigd")
+        return
+
+    sr_hashes = sr_hashes.drop(KEY_TABLE)
+    sr_hashes_old = sr_hashes_old.drop(KEY_TABLE)
+    inserted = sr_hashes.index.difference(sr_hashes_old.index)
+    deleted = sr_hashes_old.index.difference(sr_hashes.index)
+    common = sr_hashes.index.intersection(sr_hashes_old.index)
+    updated = common[sr_hashes[common].values != sr_hashes_old[common].values]
+
+    with engine.begin() as connection:
+        target = publication.stage(connection, name, copy=True)
+        delete_keys(connection, target, keys, list(deleted.union(updated)))
+        df_rows = df.loc[sleutels.isin(inserted.union(updated))]
+        schema.insert_rows(connection, df_rows, target)
+
+        target_hash = publication.stage(connection, TABLE_HASH, copy=True)
+        delete_hashes(
+            connection,
+            name,
+            list(deleted.union(updated)) + [KEY_TABLE],
+            target=target_hash,
+        )
+        sr_changed = sr_hashes[inserted.union(updated)]
+        sr_changed[KEY_TABLE] = table_hash(df, sr_hashes)
+        write_hashes(connection, name, sr_changed, target=target_hash)
+    print(
+        f"{name}: {len(inserted)} nieuw, {len(updated)} gewijzigd, "
+        f"{len(deleted)} verwijderd"
+    )
@@ -0,0 +1,44 @@
+"""Inlezen van het Excel archief en afleiden van sorteer- en bestandskolommen
+
+Het werkboek wordt een keer geopend (openpyxl, alleen-lezen en zonder formules)
+en alle tabbladen worden in een doorloop ingelezen, in plaats van het bestand
+per tabblad opnieuw te openen en te parsen.
+"""
+
+import pandas as pd
+
+SHEETS = ["Leden", "Uitvoering", "Rollen", "Type_Media", "Bestand"]
+
+# Tussenvoegsels die achteraan de sorteernaam komen; langste eerst
+TUSSENVOEGSELS = ["van der", "van den", "van de", "van", "de", "v.d."]
+
+# Sorteernaam voor leden zonder achternaam, zodat ze achteraan staan
+ACHTERNAAM_ONBEKEND = "zzzzzzzz"
+
+
+def read_sheets(file_db: str, sheets: list = SHEETS) -> dict:
+    """Alle tabbladen van het werkboek als DataFrames, per naam"""
+    with pd.ExcelFile(file_db, engine="openpyxl") as workbook:
+        return {sheet: workbook.parse(sheet_name=sheet) for sheet in sheets}
+
+
+def achternaam_sort(sr_achternaam: pd.Series) -> pd.Series:
+    """Achternaam met het tussenvoegsel achteraan: 'van Dijk' -> 'Dijk, van'"""
+    sr_achternaam = sr_achternaam.astype(object)
+    sr_sort = sr_achternaam
+    found = pd.Series(False, index=sr_achternaam.index)
+    for tussenvoegsel in TUSSENVOEGSELS:
+        mask = ~found & sr_achternaam.str.startswith(tussenvoegsel, na=False)
+        sr_sort = sr_sort.mask(
+            mask,
+            sr_achternaam.str.replace(tussenvoegsel + " ", "", regex=False)
+            + ", "
+            + tussenvoegsel,
+        )
+        found = found | mask
+    return sr_sort.mask(sr_achternaam.isna(), ACHTERNAAM_ONBEKEND)
+
+
+def file_ext(sr_bestand: pd.Series) -> pd.Series:
+    """Extensie van een bestandsnaam, in kleine letters"""
+    return sr_bestand.str.rsplit(".", n=1).str[-1].str.lower()
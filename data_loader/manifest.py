@@ -0,0 +1,98 @@
+"""Manifest van alle media en thumbnails in de media directory
+
+Per bestand worden grootte, mtime (ns), afmetingen in pixels (voor afbeeldingen)
+en sha1 van de inhoud vastgelegd in manifest.json in de media directory, met het
+pad relatief ten opzichte van die directory als sleutel. De app laadt het
+manifest in het geheugen, zodat pagina's en /cdn niet per request het bestand
+op schijf hoeven te controleren. Een bestand dat niet in het manifest staat,
+bestaat niet.
+
+De sha1 en afmetingen van een bestand met dezelfde grootte en mtime als in het
+vorige manifest worden overgenomen in plaats van opnieuw berekend.
+
+Los te starten met: python manifest.py [--root /data/kna_resources]
+"""
+
+import argparse
+import json
+import os
+import time
+
+from PIL import Image
+
+from thumbnails import file_hash
+
+FILE_MANIFEST = "manifest.json"
+MEDIA_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif", ".pdf", ".mp4")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif")
+
+
+def dimensions(path: str) -> tuple:
+    """Breedte en hoogte van een afbeelding; alleen de header wordt gelezen"""
+    if not path.lower().endswith(IMAGE_EXTENSIONS):
+        return None, None
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except Exception:
+        return None, None
+
+
+def load_manifest(root: str) -> dict:
+    file_manifest = os.path.join(root, FILE_MANIFEST)
+    if not os.path.exists(file_manifest):
+        return {}
+    with open(file_manifest) as file:
+        return json.load(file)
+
+
+def create_manifest(root: str) -> dict:
+    """Schrijft het manifest van alle media en thumbnails onder root"""
+    time_start = time.perf_counter()
+    dict_previous = load_manifest(root)
+    dict_manifest = {}
+    qty_hashed = 0
+    for dir, dirs, files in os.walk(root):
+        dirs.sort()
+        for file in sorted(files):
+            if not file.lower().endswith(MEDIA_EXTENSIONS):
+                continue
+            path = os.path.join(dir, file)
+            stat = os.stat(path)
+            path_relative = os.path.relpath(path, root)
+            entry = dict_previous.get(path_relative)
+            if (
+                entry is None
+                or entry["size"] != stat.st_size
+                or entry["mtime"] != stat.st_mtime_ns
+            ):
+                width, height = dimensions(path)
+                entry = {
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime_ns,
+                    "width": width,
+                    "height": height,
+                    "sha1": file_hash(path),
+                }
+                qty_hashed = qty_hashed + 1
+            dict_manifest[path_relative] = entry
+
+    # In een keer vervangen, zodat de app nooit een half geschreven manifest leest
+    file_manifest = os.path.join(root, FILE_MANIFEST)
+    with open(file_manifest + ".tmp", "w") as file:
+        json.dump(dict_manifest, file)
+    os.replace(file_manifest + ".tmp", file_manifest)
+
+    duration = time.perf_counter() - time_start
+    print(
+        f"Manifest: {len(dict_manifest)} bestanden, {qty_hashed} opnieuw bepaald,"
+        f" in {duration:.1f}s"
+    )
+    return dict_manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maakt het manifest van de media")
+    parser.add_argument("--root", default="/data/kna_resources")
+    args = parser.parse_args()
+    create_manifest(root=args.root)
@@ -0,0 +1,126 @@
+"""Een import in een keer publiceren, met de vorige versie bewaard voor rollback
+
+MariaDB: tabellen worden tijdens het laden geschreven naar staging tabellen
+(<naam>_nieuw), zodat de app de live tabellen ongestoord blijft lezen. Bij
+incrementeel laden begint de staging tabel als kopie van de live tabel. Na het
+laden zet een enkel RENAME TABLE statement alle staging tabellen tegelijk live;
+de vorige versie blijft staan als <naam>_vorig.
+
+SQLite: het laden schrijft in een kopie van het databasebestand, dat daarna in
+een keer het live bestand vervangt; het vorige bestand blijft staan als
+<bestand>.vorig.
+"""
+
+import os
+
+from sqlalchemy import Engine, inspect, text
+
+STAGING = "_nieuw"
+PREVIOUS = "_vorig"
+SWAP = "_wissel"
+
+
+class Publication:
+    def __init__(self, engine: Engine) -> None:
+        """Tabellen van een import die samen worden gepubliceerd"""
+        self.engine = engine
+        self.staging = engine.dialect.name != "sqlite"
+        self.tables = []
+
+    def target(self, name: str) -> str:
+        """Tabel waarin de data van een tabel tijdens het laden wordt geschreven"""
+        return name + STAGING if self.staging else name
+
+    def stage(self, connection, name: str, copy: bool = False) -> str:
+        """Neemt een tabel op in de publicatie en geeft de staging tabel terug
+
+        Met copy begint de staging tabel als kopie van de live tabel, om die
+        daarna incrementeel bij te werken.
+        """
+        target = self.target(name)
+        if name in self.tables:
+            return target
+        self.tables.append(name)
+        if self.staging and copy and inspect(connection).has_table(name):
+            connection.execute(text(f"DROP TABLE IF EXISTS {target}"))
+            connection.execute(text(f"CREATE TABLE {target} LIKE {name}"))
+            connection.execute(text(f"INSERT INTO {target} SELECT * FROM {name}"))
+        return target
+
+    def publish(self) -> None:
+        """Zet alle staging tabellen in een atomische stap live"""
+        if not self.staging or len(self.tables) == 0:
+            return
+        with self.engine.begin() as connection:
+            # Alleen de tabellen van deze publicatie hebben straks een vorige versie
+            tables = inspect(connection).get_table_names()
+            for table in tables:
+                if table.endswith(PREVIOUS):
+                    connection.execute(text(f"DROP TABLE {table}"))
+            renames = []
+            for name in self.tables:
+                if name in tables:
+                    renames.append(f"{name} TO {name}{PREVIOUS}")
+                renames.append(f"{name}{STAGING} TO {name}")
+            connection.execute(text("RENAME TABLE " + ", ".join(renames)))
+        print(f"Gepubliceerd: {', '.join(self.tables)}")
+
+
+def rollback(engine: Engine) -> list:
+    """Zet de vorige versie van de tabellen terug; de huidige wordt de vorige"""
+    with engine.begin() as connection:
+        tables = inspect(connection).get_table_names()
+        names = [
+            table.removesuffix(PREVIOUS) for table in tables if table.endswith(PREVIOUS)
+        ]
+        if len(names) == 0:
+            return names
+        renames = []
+        for name in names:
+            if name in tables:
+                renames.append(f"{name} TO {name}{SWAP}")
+            renames.append(f"{name}{PREVIOUS} TO {name}")
+            if name in tables:
+                renames.append(f"{name}{SWAP} TO {name}{PREVIOUS}")
+        connection.execute(text("RENAME TABLE " + ", ".join(renames)))
+    return names
+
+
+def publish_file(file_tmp: str, file: str) -> None:
+    """Vervangt een bestand in een keer, het vorige blijft als <bestand>.vorig"""
+    file_previous = file + ".vorig"
+    if os.path.exists(file):
+        if os.path.exists(file_previous):
+            os.remove(file_previous)
+        os.link(file, file_previous)
+    os.replace(file_tmp, file)
+
+
+def rollback_file(file: str) -> bool:
+    """Wisselt een bestand om met de vorige versie"""
+    file_previous = file + ".vorig"
+    if not os.path.exists(file_previous):
+        return False
+    if not os.path.exists(file):
+        os.replace(file_previous, file)
+        return True
+    file_swap = file + ".wissel"
+    if os.path.exists(file_swap):
+        os.remove(file_swap)
+    os.link(file, file_swap)
+    os.replace(file_previous, file)
+    os.replace(file_swap, file_previous)
+    return True
+
+
+def withdraw_site(dir_site: str) -> bool:
+    """Haalt de link naar de statische export van de app weg (zie app/export.py)
+
+    De export hoort bij de vorige data generatie; tot de volgende export serveert
+    NGINX alle pagina's weer via de app.
+    """
+    link = os.path.join(dir_site, "current")
+    if not os.path.lexists(link):
+        return False
+    os.remove(link)
+    return True
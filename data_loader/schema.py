@@ -0,0 +1,133 @@
+"""Schema van de KNA tabellen: kolomtypen, primaire sleutels en indexen
+
+De tabellen worden niet meer door pandas aangemaakt, maar hier met een expliciet
+schema, waarna de data in de lege tabel wordt geladen. De indexen volgen de
+zoekvragen in app/data_reader.py; app/explain_queries.py controleert dat die
+zonder volledige table scan worden uitgevoerd.
+"""
+
+import pandas as pd
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    Index,
+    MetaData,
+    PrimaryKeyConstraint,
+    String,
+    Table,
+    Text,
+    inspect,
+)
+
+# Tekstkolommen die in sleutels of indexen voorkomen hebben een vaste lengte nodig
+COLUMN_TYPES = {
+    "id_lid": String(255),
+    "lid": String(255),
+    "ref_uitvoering": String(255),
+    "bestand": String(255),
+    "folder": String(255),
+    "type_media": String(64),
+    "type": String(64),
+    "vlnr": String(16),
+    "id_file": String(16),
+    "file_ext": String(16),
+    "achternaam_sort": String(255),
+    "tabel": String(64),
+}
+
+# Rijen per insert; de MariaDB driver bundelt de rijen van een chunk tot
+# INSERT statements met meerdere rijen
+CHUNK_SIZE = 5000
+
+PRIMARY_KEYS = {
+    "lid": ["id_lid"],
+    "media_type": ["type_media"],
+    "uitvoering": ["ref_uitvoering"],
+    "file": ["ref_uitvoering", "bestand"],
+    "file_leden": ["ref_uitvoering", "bestand", "vlnr"],
+}
+
+# Secundaire indexen per tabel, afgeleid van de WHERE en JOIN condities in KnaDB
+INDEXES = {
+    "lid": [["gdpr_permission", "achternaam_sort"]],
+    "uitvoering": [["type", "jaar"], ["folder"]],
+    "file": [["id_file"], ["type_media", "ref_uitvoering"]],
+    "file_leden": [["lid", "ref_uitvoering"], ["id_file"]],
+    "rol": [["ref_uitvoering", "id_lid"], ["id_lid"]],
+    "laad_hash": [["tabel"]],
+}
+
+
+def column_type(name: str, sr_column: pd.Series):
+    if name in COLUMN_TYPES:
+        return COLUMN_TYPES[name]
+    if pd.api.types.is_bool_dtype(sr_column):
+        return Boolean()
+    if pd.api.types.is_integer_dtype(sr_column):
+        return BigInteger()
+    if pd.api.types.is_float_dtype(sr_column):
+        return Float(53)
+    if pd.api.types.is_datetime64_any_dtype(sr_column):
+        return DateTime()
+    return Text()
+
+
+def primary_key(df: pd.DataFrame, name: str) -> list:
+    """Primaire sleutel van een tabel, leeg wanneer de data die niet toelaat"""
+    keys = PRIMARY_KEYS.get(name, [])
+    if len(keys) == 0:
+        return keys
+    if df[keys].isna().any().any() or df.duplicated(subset=keys).any():
+        print(f"{name}: lege of dubbele waarden in {keys}, geen primaire sleutel")
+        return []
+    return keys
+
+
+def table(df: pd.DataFrame, name: str, target: str = None) -> Table:
+    """Tabeldefinitie voor een DataFrame, met primaire sleutel en indexen
+
+    Met target wordt de tabel onder een andere naam aangemaakt (een staging
+    tabel), met de sleutel en indexen van name.
+    """
+    keys = primary_key(df, name)
+    lst_columns = [
+        Column(column, column_type(column, df[column]), nullable=column not in keys)
+        for column in df.columns
+    ]
+    lst_constraints = []
+    if len(keys) > 0:
+        lst_constraints.append(PrimaryKeyConstraint(*keys, name=f"pk_{name}"))
+    for index in INDEXES.get(name, []):
+        if all(column in df.columns for column in index):
+            lst_constraints.append(Index(f"ix_{name}_{'_'.join(index)}", *index))
+    return Table(target or name, MetaData(), *lst_columns, *lst_constraints)
+
+
+def has_indexes(engine, df: pd.DataFrame, name: str) -> bool:
+    """Of een bestaande tabel alle indexen van het schema heeft"""
+    names = {index.name for index in table(df, name).indexes}
+    names_present = {index["name"] for index in inspect(engine).get_indexes(name)}
+    return names <= names_present
+
+
+def create_table(connection, df: pd.DataFrame, name: str, target: str = None) -> None:
+    """Vervangt een tabel door een lege tabel volgens het schema"""
+    table_new = table(df, name, target=target)
+    table_new.drop(connection, checkfirst=True)
+    table_new.create(connection)
+
+
+def insert_rows(connection, df: pd.DataFrame, name: str) -> None:
+    """Voegt rijen toe in chunks van CHUNK_SIZE"""
+    df.to_sql(
+        name, con=connection, if_exists="append", index=False, chunksize=CHUNK_SIZE
+    )
+
+
+def write_table(connection, df: pd.DataFrame, name: str, target: str = None) -> None:
+    """Maakt de tabel volgens het schema aan en laadt de data erin"""
+    create_table(connection, df, name, target=target)
+    insert_rows(connection, df, target or name)
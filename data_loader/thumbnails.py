@@ -0,0 +1,224 @@
+"""Thumbnails maken voor alle afbeeldingen in de media directory
+
+Naast de thumbnail van 300px worden per afbeelding afgeleide versies gemaakt in
+een aantal breedtes, als WebP en als JPEG voor browsers zonder WebP:
+thumbnails/w<breedte>/<bestand>.webp en .jpg. Alleen breedtes kleiner dan de
+afbeelding zelf worden gemaakt; de app gebruikt deze en het origineel voor
+srcset.
+
+Afbeeldingen worden verdeeld over een pool van processen. Per bron worden de
+sha1, grootte en mtime bewaard in thumbnail_hashes.json in de media directory.
+Een afbeelding wordt overgeslagen wanneer de bron nog dezelfde grootte en mtime
+heeft als de vorige keer, en niet opnieuw gemaakt wanneer de inhoud (sha1)
+gelijk is gebleven. Afgeleide bestanden worden daarbij niet aangeraakt, zodat
+het manifest ze niet opnieuw hoeft te lezen.
+
+Los te starten met: python thumbnails.py [--root /data/kna_resources]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from PIL import Image
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+THUMBNAIL_SIZE = (300, 300)
+# Breedtes van de afgeleide versies, gelijk aan IMAGE_WIDTHS in app/data_reader.py
+DERIVATIVE_WIDTHS = [200, 400, 800, 1600]
+DERIVATIVE_FORMATS = {"webp": {"quality": 80}, "jpg": {"quality": 85}}
+FILE_HASHES = "thumbnail_hashes.json"
+
+
+def file_hash(path: str) -> str:
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def find_images(root: str) -> list:
+    """Paren van bron en thumbnail voor alle afbeeldingen buiten thumbnails/"""
+    lst_images = []
+    for dir, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if d != "thumbnails"]
+        for file in files:
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                source = os.path.join(dir, file)
+                thumbnail = os.path.join(dir, "thumbnails", file)
+                lst_images.append((source, thumbnail))
+    return lst_images
+
+
+def derivative_path(thumbnail: str, width: int, format: str) -> str:
+    dir_thumbnail, file = os.path.split(thumbnail)
+    return os.path.join(dir_thumbnail, f"w{width}", f"{file}.{format}")
+
+
+def derivative_widths(width_source: int) -> list:
+    """Breedtes van de afgeleide versies van een afbeelding; niet vergroten"""
+    return [width for width in DERIVATIVE_WIDTHS if width < width_source]
+
+
+def output_paths(thumbnail: str, width_source: int) -> list:
+    lst_paths = [thumbnail]
+    for width in derivative_widths(width_source):
+        for format in DERIVATIVE_FORMATS:
+            lst_paths.append(derivative_path(thumbnail, width, format))
+    return lst_paths
+
+
+def is_current(source: str, thumbnail: str, entry: dict) -> bool:
+    """Of thumbnail en afgeleide versies nog bij de bron horen, zonder te hashen"""
+    try:
+        if entry is None:
+            return False
+        stat = os.stat(source)
+        if (entry["size"], entry["mtime"]) != (stat.st_size, stat.st_mtime_ns):
+            return False
+        return all(map(os.path.exists, output_paths(thumbnail, entry["width"])))
+    except OSError:
+        return False
+
+
+def make_derivatives(image: Image.Image, thumbnail: str) -> None:
+    """Afgeleide versies per breedte kleiner dan de afbeelding
+
+    Versies van breedtes waarvoor de afbeelding te smal is, bijvoorbeeld van een
+    vorige, grotere versie van de bron, worden verwijderd.
+    """
+    image_rgb = image.convert("RGB")
+    lst_widths = derivative_widths(image_rgb.width)
+    for width in DERIVATIVE_WIDTHS:
+        if width not in lst_widths:
+            for format in DERIVATIVE_FORMATS:
+                Path(derivative_path(thumbnail, width, format)).unlink(missing_ok=True)
+            continue
+        height = round(image_rgb.height * width / image_rgb.width)
+        image_width = image_rgb.resize((width, height), Image.LANCZOS)
+        for format, options in DERIVATIVE_FORMATS.items():
+            path = derivative_path(thumbnail, width, format)
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            format_pil = "JPEG" if format == "jpg" else "WEBP"
+            image_width.save(path, format=format_pil, **options)
+
+
+def make_thumbnail(source: str, thumbnail: str, hash_previous: str) -> tuple:
+    """Maakt thumbnail en afgeleide versies; geeft (status, gegevens van de bron,
+    fout) terug
+
+    Is de inhoud van de bron gelijk aan de vorige keer, dan blijven de bestaande
+    bestanden ongemoeid; alleen de nieuwe grootte en mtime van de bron worden
+    bewaard, zodat de volgende keer niet opnieuw gehasht hoeft te worden.
+    """
+    try:
+        stat = os.stat(source)
+        hash_source = file_hash(source)
+        image = Image.open(source)
+        entry = {
+            "sha1": hash_source,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "width": image.width,
+        }
+        lst_outputs = output_paths(thumbnail, image.width)
+        if hash_source == hash_previous and all(map(os.path.exists, lst_outputs)):
+            image.close()
+            return "ongewijzigd", entry, None
+        Path(thumbnail).parent.mkdir(parents=True, exist_ok=True)
+        image.load()
+        make_derivatives(image, thumbnail)
+        image.thumbnail(THUMBNAIL_SIZE, Image.LANCZOS)
+        image.save(thumbnail, quality=95)
+        return "gemaakt", entry, None
+    except Exception as e:
+        return "fout", None, f"{type(e).__name__}: {e}"
+
+
+def previous_hash(dict_hashes: dict, source: str, root: str) -> str:
+    entry = dict_hashes.get(os.path.relpath(source, root))
+    return None if entry is None else entry["sha1"]
+
+
+def create_thumbnails(root: str, workers: int = None, force: bool = False) -> dict:
+    """Maakt ontbrekende en verouderde thumbnails en rapporteert de voortgang"""
+    time_start = time.perf_counter()
+    file_hashes = os.path.join(root, FILE_HASHES)
+    dict_hashes = {}
+    if os.path.exists(file_hashes):
+        with open(file_hashes) as file:
+            dict_hashes = json.load(file)
+        # Bronnen zonder breedte (eerdere versie) worden opnieuw gemaakt, zodat
+        # te brede afgeleide versies verdwijnen
+        dict_hashes = {
+            source: entry
+            for source, entry in dict_hashes.items()
+            if isinstance(entry, dict) and "width" in entry
+        }
+
+    lst_images = find_images(root)
+    lst_todo = [
+        (source, thumbnail)
+        for source, thumbnail in lst_images
+        if force
+        or not is_current(
+            source, thumbnail, dict_hashes.get(os.path.relpath(source, root))
+        )
+    ]
+    dict_status = {"overgeslagen": len(lst_images) - len(lst_todo)}
+    workers = workers or os.cpu_count()
+    print(
+        f"Thumbnails: {len(lst_images)} afbeeldingen, {len(lst_todo)} te controleren"
+        f" met {workers} processen"
+    )
+
+    qty_report = max(1, len(lst_todo) // 20)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                make_thumbnail,
+                source,
+                thumbnail,
+                None if force else previous_hash(dict_hashes, source, root),
+            ): source
+            for source, thumbnail in lst_todo
+        }
+        for i, future in enumerate(as_completed(futures), start=1):
+            source = futures[future]
+            status, entry, error = future.result()
+            dict_status[status] = dict_status.get(status, 0) + 1
+            if entry is not None:
+                dict_hashes[os.path.relpath(source, root)] = entry
+            if error is not None:
+                print(f"Thumbnail voor {source} mislukt - {error}")
+            if i % qty_report == 0 or i == len(lst_todo):
+                print(f"Thumbnails: {i}/{len(lst_todo)} verwerkt", flush=True)
+
+    with open(file_hashes, "w") as file:
+        json.dump(dict_hashes, file)
+
+    duration = time.perf_counter() - time_start
+    throughput = len(lst_todo) / duration if duration > 0 else 0
+    print(
+        f"Thumbnails klaar in {duration:.1f}s ({throughput:.1f} afbeeldingen/s): "
+        + ", ".join(f"{qty} {status}" for status, qty in dict_status.items())
+    )
+    return dict_status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maakt thumbnails van afbeeldingen")
+    parser.add_argument("--root", default="/data/kna_resources")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Aantal processen (standaard: cores)"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Alle thumbnails opnieuw maken"
+    )
+    args = parser.parse_args()
+    create_thumbnails(root=args.root, workers=args.workers, force=args.force)
@@ -0,0 +1,309 @@
+"""Regressietest van de leesmethoden van KnaDB op een synthetisch archief
+
+De uitvoer van de leesmethoden wordt getoetst aan wat direct uit de tabellen van
+het synthetische archief (benchmark/synthetic.py) volgt: welke leden,
+voorstellingen en media erin staan, in welke volgorde en met welke aantallen.
+"""
+
+import datetime
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+DIR_TESTS = os.path.dirname(os.path.abspath(__file__))
+DIR_REPO = os.path.dirname(DIR_TESTS)
+sys.path.append(os.path.join(DIR_REPO, "app"))
+sys.path.append(os.path.join(DIR_REPO, "benchmark"))
+import synthetic  # noqa: E402
+from bench_reader import sample_keys  # noqa: E402
+from data_reader import KnaDB, encode_cursor  # noqa: E402
+
+# Niet bestaande media directory, er zijn geen bestanden nodig
+DIR_RESOURCES = "/kna_test_resources/"
+
+
+def normalize(value):
+    """Uitvoer als JSON waarden: datums als tekst, NaN en NA als None"""
+    if isinstance(value, pd.DataFrame):
+        return normalize(value.to_dict("records"))
+    if isinstance(value, dict):
+        return {str(key): normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [normalize(item) for item in value]
+    if value is None or isinstance(value, str):
+        return value
+    if pd.isna(value):
+        return None
+    if isinstance(value, (datetime.date, datetime.datetime, pd.Timestamp)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+@pytest.fixture(scope="module")
+def tables() -> dict:
+    return synthetic.generate(scale=1, seed=0)
+
+
+@pytest.fixture(scope="module")
+def db_reader(tables, tmp_path_factory) -> KnaDB:
+    file_sqlite = str(tmp_path_factory.mktemp("kna") / "kna_database.sqlite")
+    synthetic.write_sqlite(tables=tables, file_sqlite=file_sqlite)
+    return KnaDB(dir_resources=DIR_RESOURCES, backend="sqlite", file_sqlite=file_sqlite)
+
+
+@pytest.fixture(scope="module")
+def keys(tables) -> dict:
+    return sample_keys(tables)
+
+
+@pytest.fixture(scope="module")
+def leden_zichtbaar(tables) -> pd.DataFrame:
+    """Leden die op de site mogen staan"""
+    df_lid = tables["lid"]
+    return df_lid.loc[(df_lid["gdpr_permission"] == 1) & df_lid["Achternaam"].notna()]
+
+
+def test_leden(db_reader, tables, leden_zichtbaar):
+    """Alleen leden met toestemming, op achternaam, met hun aantal media"""
+    lst_lid = db_reader.leden()
+    df_expected = leden_zichtbaar.sort_values(["achternaam_sort", "id_lid"])
+    assert [lid["id_lid"] for lid in lst_lid] == df_expected["id_lid"].tolist()
+    qty_media = tables["file_leden"]["lid"].value_counts()
+    for lid in lst_lid:
+        assert lid["qty_media"] == qty_media.get(lid["id_lid"], 0)
+
+
+def test_voorstellingen(db_reader, tables):
+    """Uitvoeringen van nieuw naar oud, met alleen rollen van leden met toestemming"""
+    lst_voorstelling = db_reader.voorstellingen()
+    df_uitvoering = tables["uitvoering"]
+    df_expected = df_uitvoering.loc[df_uitvoering["type"] == "Uitvoering"]
+    df_expected = df_expected.sort_values(
+        ["jaar", "ref_uitvoering"], ascending=[False, True]
+    )
+    assert [
+        voorstelling["ref_uitvoering"] for voorstelling in lst_voorstelling
+    ] == df_expected["ref_uitvoering"].tolist()
+
+    df_lid = tables["lid"]
+    set_toestemming = set(df_lid.loc[df_lid["gdpr_permission"] == 1, "id_lid"])
+    df_rol = tables["rol"]
+    for voorstelling in lst_voorstelling:
+        df_rol_voorstelling = df_rol.loc[
+            (df_rol["ref_uitvoering"] == voorstelling["ref_uitvoering"])
+            & df_rol["id_lid"].isin(set_toestemming)
+        ]
+        assert {rol["id_lid"] for rol in voorstelling["rollen"]} == set(
+            df_rol_voorstelling["id_lid"]
+        )
+
+
+def test_timeline(db_reader, tables, leden_zichtbaar):
+    """Alle jaren met voorstellingen per type en de nieuwe leden van dat jaar"""
+    lst_timeline = db_reader.timeline()
+    df_uitvoering = tables["uitvoering"]
+    assert [jaar["jaar"] for jaar in lst_timeline] == sorted(
+        df_uitvoering["jaar"].dropna().unique()
+    )
+    df_lid = tables["lid"]
+    df_lid = df_lid.loc[df_lid["gdpr_permission"] == 1]
+    for jaar in lst_timeline:
+        df_jaar = df_uitvoering.loc[df_uitvoering["jaar"] == jaar["jaar"]]
+        dict_events = {
+            event["event_type"]: {item["ref_uitvoering"] for item in event["events"]}
+            for event in jaar["events"]
+        }
+        assert dict_events == {
+            event_type: set(df_type["ref_uitvoering"])
+            for event_type, df_type in df_jaar.groupby("type")
+        }
+        assert {lid["id_lid"] for lid in jaar["nieuwe_leden"]} == set(
+            df_lid.loc[df_lid["Startjaar"] == jaar["jaar"], "id_lid"]
+        )
+
+
+def test_lid_info(db_reader, tables, keys):
+    dict_lid = db_reader.lid_info(id_lid=keys["id_lid"])
+    df_files_leden = tables["file_leden"]
+    assert dict_lid["id_lid"] == keys["id_lid"]
+    assert dict_lid["qty_media"] == (df_files_leden["lid"] == keys["id_lid"]).sum()
+
+
+def test_lid_info_zonder_toestemming(db_reader, tables):
+    df_lid = tables["lid"]
+    for id_lid in df_lid.loc[df_lid["gdpr_permission"] != 1, "id_lid"]:
+        assert db_reader.lid_info(id_lid=id_lid) is None
+        assert db_reader.lid_rollen(id_lid=id_lid).shape[0] == 0
+
+
+def test_lid_media(db_reader, tables, keys):
+    """Alle media van het lid, per jaar van nieuw naar oud, met de rollen"""
+    lst_media = db_reader.lid_media(id_lid=keys["id_lid"])
+    df_files_leden = tables["file_leden"]
+    df_files_lid = df_files_leden.loc[df_files_leden["lid"] == keys["id_lid"]]
+    df_uitvoering = tables["uitvoering"].set_index("ref_uitvoering")
+    lst_jaren = [jaar["jaar"] for jaar in lst_media]
+    assert lst_jaren == sorted(
+        df_uitvoering.loc[df_files_lid["ref_uitvoering"].unique(), "jaar"].unique(),
+        reverse=True,
+    )
+    df_rol = tables["rol"]
+    df_rol = df_rol.loc[df_rol["id_lid"] == keys["id_lid"]]
+    lst_files = []
+    for jaar in lst_media:
+        for uitvoering in jaar["uitvoering"]:
+            ref_uitvoering = uitvoering["ref_uitvoering"]
+            assert df_uitvoering.loc[ref_uitvoering, "jaar"] == jaar["jaar"]
+            df_rol_uitvoering = df_rol.loc[df_rol["ref_uitvoering"] == ref_uitvoering]
+            assert uitvoering["rol"] == (df_rol_uitvoering["rol"].tolist() or [None])
+            lst_files.extend(file["id_file"] for file in uitvoering["media"])
+    assert sorted(lst_files) == sorted(df_files_lid["id_file"])
+
+
+def test_voorstelling_info(db_reader, tables, keys):
+    dict_voorstelling = db_reader.voorstelling_info(voorstelling=keys["voorstelling"])
+    df_uitvoering = tables["uitvoering"]
+    uitvoering = df_uitvoering.loc[
+        df_uitvoering["ref_uitvoering"] == keys["voorstelling"]
+    ].iloc[0]
+    for key in ["titel", "jaar", "auteur", "locatie", "regie"]:
+        assert dict_voorstelling[key] == uitvoering[key]
+    assert dict_voorstelling["datum_van"] == uitvoering["datum_van"].date()
+    lst_rollen = db_reader.voorstelling_rollen(voorstelling=keys["voorstelling"])
+    assert normalize(dict_voorstelling["rollen"]) == normalize(lst_rollen)
+    assert db_reader.voorstelling_info(voorstelling="bestaat niet") is None
+
+
+def test_voorstelling_media(db_reader, tables, keys):
+    """Alle bestanden van de voorstelling, per soort media"""
+    lst_media = db_reader.voorstelling_media(voorstelling=keys["voorstelling"])
+    df_file = tables["file"]
+    df_file = df_file.loc[df_file["ref_uitvoering"] == keys["voorstelling"]]
+    dict_expected = {
+        type_media.capitalize(): sorted(df_type["id_file"])
+        for type_media, df_type in df_file.groupby("type_media")
+    }
+    assert [item["type_media"] for item in lst_media] == sorted(dict_expected)
+    for item in lst_media:
+        assert sorted(file["id_file"] for file in item["files"]) == dict_expected[
+            item["type_media"]
+        ]
+
+
+def test_voorstelling_lid_media(db_reader, tables, keys):
+    lst_media = db_reader.voorstelling_lid_media(
+        voorstelling=keys["voorstelling"], lid=keys["id_lid"]
+    )
+    df_files_leden = tables["file_leden"]
+    df_expected = df_files_leden.loc[
+        (df_files_leden["lid"] == keys["id_lid"])
+        & (df_files_leden["ref_uitvoering"] == keys["voorstelling"])
+    ]
+    lst_files = [file["id_file"] for item in lst_media for file in item["files"]]
+    assert len(lst_files) > 0
+    assert sorted(lst_files) == sorted(df_expected["id_file"])
+
+
+def test_leden_uitvoeringen(db_reader):
+    """Rollen per lid gelijk aan het filteren van alle rollen per lid"""
+    df_rol = pd.read_sql(
+        sql="""
+        SELECT DISTINCT
+            u.titel,
+            u.jaar,
+            u.ref_uitvoering,
+            u.auteur,
+            r.id_lid,
+            r.qty_media
+        FROM rol r
+        INNER JOIN uitvoering u
+        ON r.ref_uitvoering = u.ref_uitvoering
+        ORDER BY u.jaar
+        """,
+        con=db_reader.engine,
+    )
+    lst_lid = db_reader.leden()
+    assert len(lst_lid) > 0
+    for lid in lst_lid:
+        df_lid_rol = df_rol.loc[df_rol["id_lid"] == lid["id_lid"]]
+        assert normalize(lid["uitvoeringen"]) == normalize(df_lid_rol)
+
+
+@pytest.fixture(scope="module")
+def db_reader_zonder_jaar(tables, tmp_path_factory) -> KnaDB:
+    """Archief waarin een aantal voorstellingen geen jaar heeft"""
+    tables = dict(tables)
+    df_uitvoering = tables["uitvoering"].copy()
+    lst_index = df_uitvoering.index[df_uitvoering["type"] == "Uitvoering"][[0, 5, 9]]
+    df_uitvoering.loc[lst_index, "jaar"] = None
+    tables["uitvoering"] = df_uitvoering
+    file_sqlite = str(tmp_path_factory.mktemp("kna") / "kna_database.sqlite")
+    synthetic.write_sqlite(tables=tables, file_sqlite=file_sqlite)
+    return KnaDB(dir_resources=DIR_RESOURCES, backend="sqlite", file_sqlite=file_sqlite)
+
+
+def all_pages(reader, limit: int) -> list:
+    lst_items = []
+    cursor = None
+    while True:
+        dict_page = reader(cursor=cursor, limit=limit)
+        lst_items.extend(dict_page["items"])
+        cursor = dict_page["next"]
+        if cursor is None:
+            return lst_items
+
+
+@pytest.mark.parametrize("limit", [1, 7, 40])
+def test_pages_volledig(db_reader, db_reader_zonder_jaar, limit):
+    """Alle pagina's na elkaar geven hetzelfde als de volledige leesmethode"""
+    lst_leden = all_pages(db_reader.leden_page, limit=limit)
+    assert normalize(lst_leden) == normalize(db_reader.leden())
+    for reader in [db_reader, db_reader_zonder_jaar]:
+        lst_voorstellingen = all_pages(reader.voorstellingen_page, limit=limit)
+        assert normalize(lst_voorstellingen) == normalize(reader.voorstellingen())
+
+
+@pytest.mark.parametrize(
+    "values",
+    [[{"a": 1}, "b"], [[1, 2], "b"], [[1], "b"], [True, "b"], [1.5, "b"], ["a"]],
+)
+def test_cursor_ongeldig(db_reader, values):
+    cursor = encode_cursor(values)
+    for reader in [db_reader.leden_page, db_reader.voorstellingen_page]:
+        with pytest.raises(ValueError):
+            reader(cursor=cursor)
+    with pytest.raises(ValueError):
+        db_reader.timeline_page(cursor=encode_cursor(values[:1]))
+
+
+def test_timeline_pages(db_reader):
+    lst_jaren = [jaar["jaar"] for jaar in all_pages(db_reader.timeline_page, limit=7)]
+    assert lst_jaren == [jaar["jaar"] for jaar in db_reader.timeline()]
+
+
+def test_jaar_zonder_sleutels(tables, keys, tmp_path_factory):
+    """Een jaar waarin type en titel ontbreken blijft staan, met lege groepen"""
+    tables = dict(tables)
+    df_uitvoering = tables["uitvoering"].copy()
+    jaar = df_uitvoering.loc[
+        df_uitvoering["ref_uitvoering"] == keys["voorstelling"], "jaar"
+    ].iloc[0]
+    df_uitvoering.loc[df_uitvoering["jaar"] == jaar, ["type", "titel"]] = None
+    tables["uitvoering"] = df_uitvoering
+    file_sqlite = str(tmp_path_factory.mktemp("kna") / "kna_database.sqlite")
+    synthetic.write_sqlite(tables=tables, file_sqlite=file_sqlite)
+    db_reader = KnaDB(
+        dir_resources=DIR_RESOURCES, backend="sqlite", file_sqlite=file_sqlite
+    )
+
+    dict_timeline = {item["jaar"]: item for item in db_reader.timeline()}
+    assert dict_timeline[jaar]["events"] == []
+    dict_lid_media = {
+        item["jaar"]: item for item in db_reader.lid_media(id_lid=keys["id_lid"])
+    }
+    assert dict_lid_media[jaar]["uitvoering"] == []